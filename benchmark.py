@@ -0,0 +1,864 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import timedelta
+
+import matplotlib.pyplot as plt
+import networkx as nx
+import numpy as np
+from skyfield.api import load
+from skyfield.toposlib import Topos
+
+import catalog
+import instrumentation
+from ephemeris import EphemerisStore
+from graph import SatelliteGraph
+from propagation import window_times, propagate_itrs, itrs_to_geodetic
+from satellite_tracker import SatelliteTracker
+from temporal_routing import HOP_PROCESSING_S, TimeExpandedGraph
+from utils import cartesian_coordinates, cartesian_distance, ground_station_xyz
+from visualization import Basemap, SatelliteVisualization
+
+# Coppia di città e istante usati da main.py per il Test 1
+CITY1 = Topos(latitude_degrees=40.7128, longitude_degrees=-74.0060)  # New York
+CITY2 = Topos(latitude_degrees=51.3026, longitude_degrees=-0.0739)  # London
+
+
+# Epoche fisse (UTC) della suite per stadi, vicine all'epoca dei TLE di gp.txt
+STAGE_EPOCHS = ((2025, 2, 10, 12, 00, 00), (2025, 2, 10, 18, 00, 00))
+# File delle baseline della suite per stadi
+STAGE_BASELINE = "benchmark_baseline.json"
+
+
+def start_time():
+    ts = load.timescale()
+    return ts.utc(2025, 2, 10, 12, 00, 00)
+
+
+def benchmark_filter_satellites(tle_file="gp.txt"):
+    """
+    Confronta il ciclo scalare di filter_satellites con la propagazione
+    vettoriale sulla stessa finestra e verifica che i satelliti validati
+    coincidano (nome, piano, indici, track e posizione ECEF), anche
+    disattivando il prefiltro orbitale e la ricerca a passi grossolani.
+    """
+    tracker_scalar = SatelliteTracker(CITY1, CITY2, start_time(), False, tle_file)
+    t0 = time.perf_counter()
+    scalar = tracker_scalar.filter_satellites(vectorized=False)
+    time_scalar = time.perf_counter() - t0
+
+    tracker_vector = SatelliteTracker(CITY1, CITY2, start_time(), False, tle_file)
+    t0 = time.perf_counter()
+    vector = tracker_vector.filter_satellites(vectorized=True)
+    time_vector = time.perf_counter() - t0
+
+    # Senza prefiltro orbitale e passi grossolani i satelliti validati devono essere gli stessi
+    tracker_full = SatelliteTracker(CITY1, CITY2, start_time(), False, tle_file)
+    instrumentation.reset()
+    instrumentation.enable()
+    t0 = time.perf_counter()
+    full = tracker_full.filter_satellites(vectorized=True, prefilter=False, adaptive=False)
+    time_full = time.perf_counter() - t0
+    evaluations_full = instrumentation.counters().get("sgp4_evaluations", 0)
+    instrumentation.reset()
+    tracker_vector.filter_satellites(vectorized=True)
+    evaluations_vector = instrumentation.counters().get("sgp4_evaluations", 0)
+    instrumentation.disable()
+    instrumentation.reset()
+
+    assert [s['name'] for s in scalar] == [s['name'] for s in vector] == [s['name'] for s in full]
+    max_diff = 0.0
+    for a, b in zip(scalar, vector):
+        assert a['plane'] == b['plane']
+        assert a['plane_index'] == b['plane_index']
+        assert a['sat_index_in_plane'] == b['sat_index_in_plane']
+        max_diff = max(max_diff, np.abs(np.array(a['track']) - np.array(b['track'])).max(),
+                       np.abs(a['xyz'] - b['xyz']).max())
+
+    print(f"\nfilter_satellites su {len(tracker_scalar.satellites)} satelliti "
+          f"({len(vector)} validati)")
+    print(f"Ciclo scalare:  {time_scalar:.3f} s")
+    print(f"Vettoriale:     {time_vector:.3f} s")
+    print(f"Speedup:        {time_scalar / time_vector:.1f}x")
+    print(f"Senza prefiltro né passi grossolani: {time_full:.3f} s "
+          f"({tracker_vector.prefilter_skipped} satelliti esclusi dal prefiltro)")
+    print(f"Valutazioni SGP4: {evaluations_vector} invece di {evaluations_full} "
+          f"({evaluations_full / evaluations_vector:.1f}x in meno)")
+    print(f"Differenza massima nei track e nelle posizioni ECEF: {max_diff:.3e}")
+
+
+def benchmark_satellite_records(tle_file="gp.txt", n_satellites=3000):
+    """
+    Memoria e tempo dei record dei satelliti validati: lista di dict con il
+    track come lista di tuple (formato precedente) rispetto a SatelliteTable,
+    per n_satellites satelliti con la finestra completa di 5 minuti; verifica
+    che assign_plane_and_position dia gli stessi indici nei due formati.
+    """
+    tracker = SatelliteTracker(CITY1, CITY2, start_time(), False, tle_file)
+    xyz = propagate_itrs(tracker.satellites, window_times(tracker.ts, tracker.start_time, tracker.end_time))
+    # Solo satelliti senza errori SGP4 nella finestra, come quelli validati da filter_satellites
+    indices = np.flatnonzero(np.isfinite(xyz).all(axis=(1, 2)))[:n_satellites]
+    satellites = [tracker.satellites[i] for i in indices]
+    xyz = xyz[indices]
+    lat, lon, alt = itrs_to_geodetic(xyz)
+    middle = xyz.shape[1] // 2
+
+    def build_dicts():
+        return [{'name': sat.name, 'track': list(zip(lat[i], lon[i], alt[i])),
+                 'plane': np.degrees(sat.model.nodeo) % 360, 'xyz': np.array(xyz[i, middle])}
+                for i, sat in enumerate(satellites)]
+
+    def build_table():
+        tracker._set_validated(satellites, np.stack([lat, lon, alt], axis=-1), xyz[:, middle])
+        return tracker.satellite_validated
+
+    results = {}
+    for label, build in (("dict", build_dicts), ("table", build_table)):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        records = build()
+        time_build = time.perf_counter() - t0
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        t0 = time.perf_counter()
+        if label == "dict":
+            _assign_plane_and_position_dicts(records)
+        else:
+            tracker.assign_plane_and_position()
+        results[label] = (records, time_build, time.perf_counter() - t0, memory)
+
+    dicts, table = results["dict"][0], results["table"][0]
+    assert all(a['plane_index'] == b['plane_index'] and a['sat_index_in_plane'] == b['sat_index_in_plane']
+               for a, b in zip(dicts, table))
+
+    print(f"\nRecord di {len(satellites)} satelliti con {xyz.shape[1]} campioni di track")
+    print(f"{'Formato':<14} {'Costruzione (s)':>16} {'Piani (s)':>10} {'Memoria (MB)':>13}")
+    for label, name in (("dict", "lista di dict"), ("table", "SatelliteTable")):
+        _, time_build, time_assign, memory = results[label]
+        print(f"{name:<14} {time_build:>16.3f} {time_assign:>10.4f} {memory / 2 ** 20:>13.1f}")
+
+
+def _assign_plane_and_position_dicts(satellites, angle_threshold=10):
+    # assign_plane_and_position sui record dict del formato precedente (riferimento del benchmark)
+    plane_dict = {}
+    for sat in satellites:
+        sat['plane_index'] = int(sat['plane'] // angle_threshold)
+        plane_dict.setdefault(sat['plane_index'], []).append(sat)
+    for sat_list in plane_dict.values():
+        for sat in sat_list:
+            sat['lat'] = float(itrs_to_geodetic(sat['xyz'])[0])
+        sat_list.sort(key=lambda x: x['lat'])
+        for i, sat in enumerate(sat_list):
+            sat['sat_index_in_plane'] = i
+
+
+def constellation_snapshot(tle_file="gp.txt", n_nodes=None, seed=0):
+    """
+    Record dei satelliti (come quelli di filter_satellites, con un track di un
+    solo punto) per tutto il catalogo all'istante di riferimento, senza filtro
+    geografico; se n_nodes è indicato se ne estrae un sottoinsieme casuale.
+    """
+    ts = catalog.get_timescale()
+    satellites = catalog.load_satellites(tle_file)
+    t0 = start_time()
+    t = ts.tt_jd(np.array([t0.whole]), np.array([t0.tt_fraction]))
+    xyz = propagate_itrs(satellites, t)[:, 0, :]
+    lat, lon, alt = itrs_to_geodetic(xyz)
+
+    indices = np.flatnonzero(np.isfinite(alt))
+    if n_nodes is not None and n_nodes < len(indices):
+        indices = np.sort(np.random.default_rng(seed).choice(indices, n_nodes, replace=False))
+
+    return [{'name': satellites[i].name,
+             'track': [(lat[i], lon[i], alt[i])],
+             'plane': np.degrees(satellites[i].model.nodeo) % 360,
+             'xyz': xyz[i]}
+            for i in indices]
+
+
+def benchmark_connect_nodes(sizes=(100, 500, 1000, 2000, 4000, 7000), LISL_range=1300,
+                            brute_force_limit=2000):
+    """
+    Scalabilità di connect_nodes (topologia libera) con l'indice spaziale
+    rispetto al doppio ciclo su tutte le coppie. Il confronto con il doppio
+    ciclo, che è quadratico, si esegue solo fino a brute_force_limit nodi.
+    """
+    print(f"\nconnect_nodes con LISL_range = {LISL_range} km")
+    print(f"{'Nodi':>6} {'Archi':>9} {'Indice (s)':>11} {'Coppie (s)':>11} {'Speedup':>8}")
+    for n_nodes in sizes:
+        satellites = constellation_snapshot(n_nodes=n_nodes)
+
+        graph_index = SatelliteGraph(LISL_range)
+        graph_index.add_nodes(satellites)
+        t0 = time.perf_counter()
+        graph_index.connect_nodes(use_index=True)
+        time_index = time.perf_counter() - t0
+
+        if len(satellites) <= brute_force_limit:
+            graph_brute = SatelliteGraph(LISL_range)
+            graph_brute.add_nodes(satellites)
+            t0 = time.perf_counter()
+            graph_brute.connect_nodes(use_index=False)
+            time_brute = time.perf_counter() - t0
+            assert list(graph_index.G.edges(data='weight')) == list(graph_brute.G.edges(data='weight'))
+            brute = f"{time_brute:>11.3f} {time_brute / time_index:>7.1f}x"
+        else:
+            brute = f"{'-':>11} {'-':>8}"
+
+        print(f"{len(satellites):>6} {graph_index.G.number_of_edges():>9} {time_index:>11.3f} {brute}")
+
+
+def benchmark_plus_grid(LISL_range=1300):
+    """
+    Candidati +Grid con l'indice PlaneGrid rispetto alla ricerca lineare nei
+    piani adiacenti, per tutti i satelliti nella fascia di altitudine
+    (regione estesa a tutto il globo): a parte le coppie fra l'ultimo piano
+    e il piano 0, che solo l'indice collega, i candidati devono coincidere.
+    """
+    tracker = SatelliteTracker(CITY1, CITY2, start_time(), False)
+    tracker.regions = [(-90, 90, -180, 180, False)]
+    satellites = tracker.filter_satellites()
+    sat_graph = SatelliteGraph(LISL_range)
+    sat_graph.add_nodes(satellites)
+    grid = satellites.plane_grid
+
+    t0 = time.perf_counter()
+    scan = _plus_grid_candidates_scan(sat_graph.G)
+    time_scan = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    indexed = grid.plus_grid_candidates()
+    time_index = time.perf_counter() - t0
+
+    last_plane = grid.n_planes - 1
+    wrap = [(a, b) for a, b in indexed
+            if {sat_graph.G.nodes[a]['plane_index'], sat_graph.G.nodes[b]['plane_index']} == {0, last_plane}]
+    assert [pair for pair in indexed if pair not in set(wrap)] == scan
+
+    sizes = [len(members) for members in grid.planes.values()]
+    print(f"\nCandidati +Grid per {len(satellites)} satelliti in {len(sizes)} piani (fino a {max(sizes)} per piano)")
+    print(f"Ricerca lineare: {time_scan:.3f} s ({len(scan)} candidati)")
+    print(f"PlaneGrid:       {time_index:.3f} s ({len(indexed)} candidati, {len(wrap)} fra i piani {last_plane} e 0)")
+    print(f"Speedup:         {time_scan / time_index:.1f}x")
+
+
+def _plus_grid_candidates_scan(G):
+    # Candidati +Grid con la scansione lineare dei piani adiacenti (riferimento del benchmark)
+    plane_dict = {}
+    for node_name, attrs in G.nodes(data=True):
+        if attrs.get('plane_index') is not None:
+            plane_dict.setdefault(attrs['plane_index'], []).append((node_name, attrs))
+    for sat_list in plane_dict.values():
+        sat_list.sort(key=lambda x: x[1].get('sat_index_in_plane', 0))
+
+    candidates = []
+    for p_idx in sorted(plane_dict):
+        sat_list = plane_dict[p_idx]
+        for i, (node_name, attrs) in enumerate(sat_list):
+            if i > 0:
+                candidates.append((node_name, sat_list[i - 1][0]))
+            if i < len(sat_list) - 1:
+                candidates.append((node_name, sat_list[i + 1][0]))
+            for neighbour in (p_idx + 1, p_idx - 1):
+                for other, other_attrs in plane_dict.get(neighbour, []):
+                    if other_attrs.get('sat_index_in_plane') == attrs.get('sat_index_in_plane'):
+                        candidates.append((node_name, other))
+                        break
+    return candidates
+
+
+def benchmark_min_degree_repair(LISL_ranges=(1300, 2500, 5000), min_degree=2, extra_range_factor=1.2):
+    """
+    Riparazione del grado minimo di connect_nodes_hybrid su grafi +Grid con
+    tutti i satelliti nella fascia di altitudine (regione estesa a tutto il
+    globo): ricerca dei candidati di tutti i nodi sotto min_degree in
+    un'unica volta rispetto alla scansione di tutti i nodi per ciascuno.
+    Verifica che archi, pesi e ordine coincidano.
+    """
+    tracker = SatelliteTracker(CITY1, CITY2, start_time(), False)
+    tracker.regions = [(-90, 90, -180, 180, False)]
+    satellites = tracker.filter_satellites()
+
+    print(f"\nRiparazione del grado minimo su {len(satellites)} nodi (min_degree = {min_degree}, "
+          f"extra_range_factor = {extra_range_factor})")
+    print(f"{'LISL (km)':>9} {'Sotto soglia':>12} {'Archi extra':>11} {'Scansione (s)':>14} {'Vicini (s)':>11} "
+          f"{'Speedup':>8}")
+    for LISL_range in LISL_ranges:
+        sat_graph = SatelliteGraph(LISL_range)
+        sat_graph.add_nodes(satellites)
+        sat_graph.connect_nodes_plus_grid()
+        nodes = list(sat_graph.G.nodes())
+        xyz = sat_graph.node_positions()
+        under = sum(1 for node in nodes if sat_graph.G.degree(node) < min_degree)
+
+        adjacency = {node: set(sat_graph.G.adj[node]) for node in nodes}
+        t0 = time.perf_counter()
+        scan = _min_degree_repair_scan(nodes, xyz, adjacency, LISL_range * extra_range_factor, min_degree)
+        time_scan = time.perf_counter() - t0
+
+        adjacency = {node: set(sat_graph.G.adj[node]) for node in nodes}
+        t0 = time.perf_counter()
+        repair = sat_graph._min_degree_repair(nodes, xyz, adjacency, min_degree, extra_range_factor)
+        time_repair = time.perf_counter() - t0
+
+        assert repair == scan
+        print(f"{LISL_range:>9} {under:>12} {len(repair):>11} {time_scan:>14.3f} {time_repair:>11.3f} "
+              f"{time_scan / time_repair:>7.1f}x")
+
+
+def _min_degree_repair_scan(nodes, xyz, adjacency, max_distance, min_degree):
+    # Riparazione con la scansione di tutti i nodi per ogni nodo sotto soglia (riferimento del benchmark)
+    repair_edges = []
+    for k, node in enumerate(nodes):
+        if len(adjacency[node]) < min_degree:
+            distances = cartesian_distance(xyz[k], xyz)
+            candidate_neighbors = [(other, d) for other, d in zip(nodes, distances)
+                                   if other != node and other not in adjacency[node] and d <= max_distance]
+            candidate_neighbors.sort(key=lambda x: x[1])
+            for candidate, d in candidate_neighbors:
+                if len(adjacency[node]) >= min_degree:
+                    break
+                if len(adjacency[candidate]) < 4:
+                    adjacency[node].add(candidate)
+                    adjacency[candidate].add(node)
+                    repair_edges.append((node, candidate, d))
+    return repair_edges
+
+
+def benchmark_ground_access(n_stations=50, k=4, min_elevation=25.0, seed=0):
+    """
+    Satelliti di accesso di n_stations stazioni a terra casuali su tutti i
+    satelliti nella fascia di altitudine: una chiamata di
+    find_satellite_more_close per stazione rispetto a find_access_satellites
+    per tutte insieme (verifica che il più vicino coincida), più la variante
+    con i k migliori e la maschera di elevazione.
+    """
+    tracker = SatelliteTracker(CITY1, CITY2, start_time(), False)
+    tracker.regions = [(-90, 90, -180, 180, False)]
+    satellites = tracker.filter_satellites()
+    rng = np.random.default_rng(seed)
+    stations = [Topos(latitude_degrees=lat, longitude_degrees=lon)
+                for lat, lon in zip(rng.uniform(-60, 60, n_stations), rng.uniform(-180, 180, n_stations))]
+
+    t0 = time.perf_counter()
+    loop = [_find_satellite_more_close_loop(station.latitude.degrees, station.longitude.degrees, satellites)
+            for station in stations]
+    time_loop = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    batch = [nodes[0] for nodes in tracker.find_access_satellites(stations, satellites)]
+    time_batch = time.perf_counter() - t0
+    assert batch == loop
+
+    t0 = time.perf_counter()
+    masked = tracker.find_access_satellites(stations, satellites, k=k, min_elevation=min_elevation)
+    time_masked = time.perf_counter() - t0
+
+    print(f"\nAccesso terra-satellite di {n_stations} stazioni su {len(satellites)} satelliti")
+    print(f"Una ricerca per stazione: {time_loop:.3f} s")
+    print(f"Ricerca vettoriale: {time_batch:.3f} s ({time_loop / time_batch:.1f}x)")
+    print(f"k = {k}, elevazione minima {min_elevation}°: {time_masked:.3f} s, "
+          f"stazioni senza satelliti visibili: {sum(1 for nodes in masked if not nodes)}")
+
+
+def _find_satellite_more_close_loop(city_lat, city_lon, satellites):
+    # Ricerca del satellite più vicino a una città scorrendo i record (riferimento del benchmark)
+    distances = cartesian_distance(ground_station_xyz(city_lat, city_lon), np.array([sat['xyz'] for sat in satellites]))
+    sat = satellites[int(np.argmin(distances))]
+    return (sat['name'], sat['lat'], sat['lon'])
+
+
+def benchmark_city_matrix(n_cities=20, LISL_range=2500, load_factor=0.15, seed=0):
+    """
+    Matrici di latenza fra tutte le coppie di n_cities città casuali su un
+    grafo +Grid globale (backend CSR): Dijkstra e min-hop coppia per coppia,
+    come in route_city_pair, rispetto a city_path_matrices con un albero per
+    città. Verifica che le matrici Dijkstra coincidano e che gli hop MinHop
+    siano gli stessi, anche per due città vicine con lo stesso satellite di
+    accesso (percorso di un solo satellite, 0 hop).
+    """
+    tracker = SatelliteTracker(CITY1, CITY2, start_time(), False)
+    tracker.regions = [(-90, 90, -180, 180, False)]
+    satellites = tracker.filter_satellites()
+    sat_graph = SatelliteGraph(LISL_range, "csr")
+    sat_graph.add_nodes(satellites)
+    with contextlib.redirect_stdout(io.StringIO()):
+        sat_graph.connect_nodes_hybrid()
+
+    rng = np.random.default_rng(seed)
+    cities = [Topos(latitude_degrees=lat, longitude_degrees=lon)
+              for lat, lon in zip(rng.uniform(-55, 60, n_cities - 1), rng.uniform(-180, 180, n_cities - 1))]
+    # Una città a pochi km dalla prima, con lo stesso satellite di accesso
+    cities.append(Topos(latitude_degrees=cities[0].latitude.degrees + 0.05,
+                        longitude_degrees=cities[0].longitude.degrees))
+    access_nodes = [nodes[0][0] for nodes in tracker.find_access_satellites(cities, satellites)]
+    assert access_nodes[0] == access_nodes[-1]
+
+    t0 = time.perf_counter()
+    half_rtt_d = np.zeros((n_cities, n_cities))
+    n_hops_m = np.zeros((n_cities, n_cities), dtype=np.int32)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, source in enumerate(access_nodes):
+            for j, target in enumerate(access_nodes):
+                if i == j:
+                    continue
+                path_d, _ = sat_graph.find_shortest_path_Dijkstra(source, target)
+                path_m, _ = sat_graph.find_shortest_path_minHop(source, target)
+                (latency_d, _), _ = sat_graph.calculate_total_latencies([path_d, path_m], cities[i], cities[j],
+                                                                        load_factor)
+                half_rtt_d[i, j] = latency_d * 1000 + len(path_d)
+                n_hops_m[i, j] = len(path_m) - 1
+    time_pairs = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    matrices = sat_graph.city_path_matrices(access_nodes, [city.itrs_xyz.km for city in cities], load_factor)
+    time_matrix = time.perf_counter() - t0
+
+    assert np.array_equal(matrices['half_rtt_d'], half_rtt_d)
+    assert np.array_equal(matrices['n_hops_m'], n_hops_m)
+    assert matrices['n_hops_d'][0, -1] == 0 and np.isfinite(matrices['half_rtt_d'][0, -1])
+    print(f"\nMatrice delle latenze fra {n_cities} città ({n_cities * (n_cities - 1)} coppie) su "
+          f"{sat_graph.number_of_nodes()} nodi, LISL {LISL_range} km")
+    print(f"Coppia per coppia: {time_pairs:.3f} s")
+    print(f"Un albero per città: {time_matrix:.3f} s ({time_pairs / time_matrix:.1f}x)")
+
+
+def benchmark_routing(n_nodes=4000, LISL_ranges=(1300, 2500, 5000), n_queries=20, seed=0):
+    """
+    Dijkstra e min-hop su grafo NetworkX e su grafo CSR per lo stesso
+    snapshot: verifica che i percorsi coincidano e confronta tempi e memoria
+    occupata dagli array del grafo CSR.
+    """
+    satellites = constellation_snapshot(n_nodes=n_nodes, seed=seed)
+    rng = np.random.default_rng(seed)
+    names = [sat['name'] for sat in satellites]
+    queries = [tuple(rng.choice(len(names), 2, replace=False)) for _ in range(n_queries)]
+
+    print(f"\nInstradamento su {len(satellites)} nodi, {n_queries} coppie sorgente-destinazione")
+    print(f"{'LISL (km)':>9} {'Archi':>9} {'NetworkX (s)':>13} {'CSR (s)':>9} {'Speedup':>8} {'CSR (MB)':>9}")
+    for LISL_range in LISL_ranges:
+        graph = SatelliteGraph(LISL_range)
+        graph.add_nodes(satellites)
+        graph.connect_nodes()
+        csr = graph.get_csr()
+
+        t0 = time.perf_counter()
+        paths_nx = [_route(lambda a, b: nx.dijkstra_path(graph.G, a, b), names[a], names[b]) for a, b in queries]
+        paths_nx += [_route(lambda a, b: nx.shortest_path(graph.G, a, b), names[a], names[b]) for a, b in queries]
+        time_nx = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        paths_csr = [_route(csr.dijkstra_path, names[a], names[b]) for a, b in queries]
+        paths_csr += [_route(csr.shortest_path, names[a], names[b]) for a, b in queries]
+        time_csr = time.perf_counter() - t0
+
+        assert paths_nx == paths_csr
+        print(f"{LISL_range:>9} {csr.number_of_edges():>9} {time_nx:>13.3f} {time_csr:>9.3f} "
+              f"{time_nx / time_csr:>7.1f}x {csr.nbytes() / 1e6:>9.2f}")
+
+
+def benchmark_temporal_routing(steps=(30, 10), LISL_range=1300, load_factor=0.15):
+    """
+    Grafo espanso nel tempo su 90 minuti per tutto il catalogo: tempo di
+    costruzione di uno strato, primo arrivo, latenza minima sulla finestra e
+    memoria degli strati in cache.
+    """
+    print(f"\nGrafo espanso nel tempo, 90 minuti, LISL_range = {LISL_range} km")
+    print(f"{'Passo (s)':>9} {'Strati':>7} {'Archi/strato':>13} {'Strato (s)':>11} "
+          f"{'Primo arrivo (s)':>17} {'Lat. minima (s)':>16} {'Cache (MB)':>11}")
+    for step in steps:
+        graph = TimeExpandedGraph(start_time(), step=timedelta(seconds=step), LISL_range=LISL_range,
+                                  load_factor=load_factor)
+        t0 = time.perf_counter()
+        graph.layer(0)
+        time_layer = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        graph.earliest_arrival(CITY1, CITY2)
+        time_earliest = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        graph.min_latency(CITY1, CITY2)
+        time_min = time.perf_counter() - t0
+
+        print(f"{step:>9} {graph.n_layers:>7} {len(graph.layer(0)[1]) // 2:>13} {time_layer:>11.3f} "
+              f"{time_earliest:>17.3f} {time_min:>16.3f} {graph.nbytes() / 1e6:>11.2f}")
+
+
+def benchmark_temporal_routing_check(n_scenarios=200, n_satellites=12, n_layers=20, LISL_range=1500,
+                                     load_factor=0.995, seed=0):
+    """
+    Verifica di earliest_arrival su effemeridi sintetiche (n_satellites in
+    moto casuale a 530 km fra le due città, strati da 1 s): il fattore di
+    carico vicino a 1 rende i collegamenti lunghi quanto uno strato, così i
+    pacchetti arrivano spesso dopo la fine dello strato e devono essere
+    tenuti a bordo. Il tempo di arrivo deve coincidere con quello di una
+    ricerca esaustiva che rilassa tutti gli archi di ogni strato fino a convergenza.
+    """
+    ts = load.timescale()
+    t0 = ts.utc(2025, 2, 10, 12, 00, 00)
+    city1 = Topos(latitude_degrees=5.0, longitude_degrees=2.0)
+    city2 = Topos(latitude_degrees=15.0, longitude_degrees=18.0)
+    satellites = [_ToySatellite(f"TOY-{i}") for i in range(n_satellites)]
+    rng = np.random.default_rng(seed)
+
+    reached = 0
+    for _ in range(n_scenarios):
+        lat = rng.uniform(0, 20, n_satellites) + np.cumsum(rng.normal(0, 0.3, (n_layers + 1, n_satellites)), axis=0)
+        lon = rng.uniform(0, 20, n_satellites) + np.cumsum(rng.normal(0, 0.3, (n_layers + 1, n_satellites)), axis=0)
+        positions = cartesian_coordinates(lat, lon, 530.0)
+        ephemeris = EphemerisStore(satellites, t0, 1.0, np.stack(positions, axis=-1))
+        graph = TimeExpandedGraph(t0, duration=timedelta(seconds=n_layers), step=timedelta(seconds=1),
+                                  LISL_range=LISL_range, load_factor=load_factor, ephemeris=ephemeris)
+        result = graph.earliest_arrival(city1, city2)
+        expected = _earliest_arrival_brute_force(graph, city1, city2)
+        assert (result is None) == (expected is None), (result, expected)
+        if result is not None:
+            assert np.isclose(result['arrival'], expected), (result['arrival'], expected)
+            reached += 1
+    print(f"\nPrimo arrivo su {n_scenarios} scenari sintetici: coincide con la ricerca esaustiva "
+          f"({reached} con percorso nella finestra)")
+
+
+class _ToySatellite:
+    # Satellite delle effemeridi sintetiche: al grafo espanso nel tempo serve solo il nome
+    def __init__(self, name):
+        self.name = name
+
+
+def _earliest_arrival_brute_force(graph, city1, city2):
+    # Primo arrivo rilassando tutti gli archi di ogni strato fino a convergenza (riferimento del benchmark)
+    carried = {}
+    for k in range(graph.n_layers):
+        start, end = graph.layer_time(k), graph.layer_time(k + 1)
+        source, uplink = graph.access(city1, k)
+        arrival = dict(carried)
+        arrival[source] = min(arrival.get(source, np.inf), start + uplink + HOP_PROCESSING_S)
+        indptr, indices, costs = graph.layer(k)
+        changed = True
+        while changed:
+            changed = False
+            for v, time_v in list(arrival.items()):
+                if time_v >= end:
+                    continue
+                for u, cost in zip(indices[indptr[v]:indptr[v + 1]].tolist(), costs[indptr[v]:indptr[v + 1]].tolist()):
+                    if time_v + cost < arrival.get(u, np.inf):
+                        arrival[u] = time_v + cost
+                        changed = True
+        target, downlink = graph.access(city2, k)
+        if arrival.get(target, np.inf) < end:
+            return arrival[target] + downlink
+        carried = {node: max(time_v, end) for node, time_v in arrival.items()}
+    return None
+
+
+def benchmark_render_map(LISL_ranges=(1300, 2500, 5000), dpi=100):
+    """
+    Mappa dello snapshot New York - Londra (topologia libera) disegnata con
+    un artista per arco e per nodo e una Basemap nuova per figura, rispetto
+    a LineCollection, scatter unico e Basemap in cache. I tempi includono il
+    salvataggio del PNG (in memoria) a dpi punti per pollice.
+    """
+    plt.switch_backend("Agg")
+    tracker = SatelliteTracker(CITY1, CITY2, start_time(), False)
+    satellites = tracker.filter_satellites()
+    start = tracker.find_satellite_more_close(CITY1.latitude.degrees, CITY1.longitude.degrees, satellites)
+    end = tracker.find_satellite_more_close(CITY2.latitude.degrees, CITY2.longitude.degrees, satellites)
+
+    print(f"\nMappa di {len(satellites)} satelliti a {dpi} dpi")
+    print(f"{'LISL (km)':>9} {'Archi':>7} {'Per artista (s)':>16} {'Collezioni (s)':>15} {'Speedup':>8}")
+    for LISL_range in LISL_ranges:
+        graph = SatelliteGraph(LISL_range)
+        graph.add_nodes(satellites)
+        graph.connect_nodes()
+        G = graph.get_graph()
+        path_d = _route(lambda a, b: nx.dijkstra_path(G, a, b), start[0], end[0])
+        path_m = _route(lambda a, b: nx.shortest_path(G, a, b), start[0], end[0])
+
+        # Una prima figura costruisce la Basemap in cache, come il primo snapshot di una simulazione
+        _render(G, start, end, path_d, path_m, dpi)
+
+        t0 = time.perf_counter()
+        _render_per_artist(G, start, end, path_d, path_m, dpi)
+        time_artists = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        _render(G, start, end, path_d, path_m, dpi)
+        time_collections = time.perf_counter() - t0
+
+        print(f"{LISL_range:>9} {G.number_of_edges():>7} {time_artists:>16.3f} {time_collections:>15.3f} "
+              f"{time_artists / time_collections:>7.1f}x")
+
+
+def _render(G, start, end, path_d, path_m, dpi):
+    viz = SatelliteVisualization("New York", "Londra", CITY1, CITY2, G, [], start, end, False, False, False)
+    viz.draw_map()
+    viz.add_cities()
+    viz.plot_edges(path_d, path_m, None)
+    viz.plot_nodes(path_d)
+    plt.savefig(io.BytesIO(), format="png", dpi=dpi)
+    plt.close('all')
+
+
+def _render_per_artist(G, start, end, path_d, path_m, dpi):
+    # Disegno di riferimento: Basemap nuova, un Polygon per ogni continente e una chiamata
+    # a plot per ogni arco, segmento di percorso e nodo
+    viz = SatelliteVisualization("New York", "Londra", CITY1, CITY2, G, [], start, end, False, False, False)
+    m = viz.m = Basemap(projection='merc', llcrnrlat=viz.m.llcrnrlat, urcrnrlat=viz.m.urcrnrlat,
+                        llcrnrlon=viz.m.llcrnrlon, urcrnrlon=viz.m.urcrnrlon, resolution='i')
+    m.drawcoastlines()
+    m.drawcountries()
+    m.fillcontinents(color='lightgray')
+    m.drawparallels(np.arange(0, 91, 10), labels=[True, False, False, False], color='lightgray', linewidth=0.5)
+    m.drawmeridians(np.arange(-110, 41, 10), labels=[False, False, False, True], color='lightgray', linewidth=0.5)
+    viz.add_cities()
+    for u, v in G.edges():
+        x, y = m([G.nodes[u]['lon'], G.nodes[v]['lon']], [G.nodes[u]['lat'], G.nodes[v]['lat']])
+        m.plot(x, y, color='red', linewidth=0.2)
+    for path, color in ((path_d, 'cyan'), (path_m, 'lime')):
+        for u, v in zip(path or [], (path or [])[1:]):
+            x, y = m([G.nodes[u]['lon'], G.nodes[v]['lon']], [G.nodes[u]['lat'], G.nodes[v]['lat']])
+            m.plot(x, y, color=color, linewidth=3)
+    for node, data in G.nodes(data=True):
+        x, y = m(data['lon'], data['lat'])
+        m.plot(x, y, marker='o', color='blue', markersize=4)
+    plt.savefig(io.BytesIO(), format="png", dpi=dpi)
+    plt.close('all')
+
+
+def benchmark_stages(sizes=(1000, 3500, None), epochs=STAGE_EPOCHS, LISL_range=1300, backend="csr",
+                     load_factor=0.15, n_queries=20, repeat=3, dpi=100, tle_file="gp.txt", seed=0,
+                     baseline=STAGE_BASELINE, threshold=0.25, min_delta_s=0.005, update_baseline=False):
+    """
+    Tempo, picco di memoria e throughput di ogni stadio della pipeline del
+    Test 1 (New York - Londra, topologia +Grid per l'instradamento) su gp.txt,
+    per ogni epoca di epochs e ogni dimensione del catalogo in sizes
+    (sottoinsieme casuale fisso, None = catalogo completo). Il tempo è il
+    minimo su repeat esecuzioni; il picco di memoria (tracemalloc) si misura
+    in un'esecuzione a parte, per non alterare i tempi.
+    I risultati si confrontano con la baseline JSON: uno stadio è una
+    regressione se è più lento di threshold (frazione) e di almeno
+    min_delta_s secondi. Se la baseline non esiste, o con update_baseline,
+    i risultati diventano la nuova baseline. Restituisce il numero di regressioni.
+    """
+    plt.switch_backend("Agg")
+    ts = catalog.get_timescale()
+    full_catalog = catalog.load_satellites(tle_file)
+    results = {}
+
+    def record(stage, n_catalog, epoch, measure, count, unit):
+        wall, peak = measure
+        results[f"{stage}/{n_catalog}/{epoch}"] = {
+            'stage': stage, 'catalog': n_catalog, 'epoch': epoch, 'wall_s': wall, 'peak_mb': peak,
+            'throughput': count / wall if wall > 0 else float('inf'), 'unit': unit,
+        }
+
+    # Lettura dei TLE dal file di testo e dalla cache binaria (non dipendono da epoca e dimensione)
+    record("tle_load_text", len(full_catalog), "-",
+           _measure(lambda: (), lambda: load.tle_file(tle_file, ts=ts), repeat), len(full_catalog), "satelliti/s")
+    record("tle_load_cache", len(full_catalog), "-",
+           _measure(lambda: (catalog.clear_memory_cache(),), lambda _: catalog.load_satellites(tle_file), repeat),
+           len(full_catalog), "satelliti/s")
+
+    render_warmed_up = False
+    for epoch in epochs:
+        t0 = ts.utc(*epoch)
+        epoch_label = t0.utc_iso()
+        for size in sizes:
+            satellites = full_catalog
+            if size is not None and size < len(full_catalog):
+                chosen = np.sort(np.random.default_rng(seed).choice(len(full_catalog), size, replace=False))
+                satellites = [full_catalog[i] for i in chosen]
+            n_catalog = len(satellites)
+
+            def tracker():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    new_tracker = SatelliteTracker(CITY1, CITY2, t0, False, tle_file)
+                new_tracker.satellites = satellites
+                return new_tracker
+
+            record("filter_satellites", n_catalog, epoch_label,
+                   _measure(lambda: (tracker(),), lambda tr: tr.filter_satellites(), repeat), n_catalog, "satelliti/s")
+
+            # Stato della pipeline per gli stadi successivi (non cronometrato)
+            validated_tracker = tracker()
+            validated = validated_tracker.filter_satellites()
+            start = validated_tracker.find_satellite_more_close(CITY1.latitude.degrees, CITY1.longitude.degrees,
+                                                                validated)
+            end = validated_tracker.find_satellite_more_close(CITY2.latitude.degrees, CITY2.longitude.degrees,
+                                                              validated)
+
+            def assign_setup():
+                tr = tracker()
+                tr.satellite_validated = validated.copy()
+                return (tr,)
+
+            record("assign_plane_and_position", n_catalog, epoch_label,
+                   _measure(assign_setup, lambda tr: tr.assign_plane_and_position(), repeat),
+                   len(validated), "satelliti/s")
+
+            def empty_graph():
+                return (SatelliteGraph(LISL_range, backend),)
+
+            def graph_with_nodes():
+                sat_graph = SatelliteGraph(LISL_range, backend)
+                sat_graph.add_nodes(validated)
+                return (sat_graph,)
+
+            def grid_graph():
+                sat_graph = graph_with_nodes()[0]
+                sat_graph.connect_nodes_hybrid()
+                return (sat_graph,)
+
+            record("add_nodes", n_catalog, epoch_label,
+                   _measure(empty_graph, lambda g: g.add_nodes(validated), repeat), len(validated), "nodi/s")
+            free = SatelliteGraph(LISL_range, backend)
+            free.add_nodes(validated)
+            free.connect_nodes()
+            record("connect_nodes", n_catalog, epoch_label,
+                   _measure(graph_with_nodes, lambda g: g.connect_nodes(), repeat),
+                   free.number_of_edges(), "archi/s")
+            sat_graph = grid_graph()[0]
+            record("connect_nodes_hybrid", n_catalog, epoch_label,
+                   _measure(graph_with_nodes, lambda g: g.connect_nodes_hybrid(), repeat),
+                   sat_graph.number_of_edges(), "archi/s")
+
+            # Coppia delle città più n_queries - 1 coppie casuali di nodi, sempre le stesse
+            names = list(sat_graph.G.nodes())
+            rng = np.random.default_rng(seed)
+            queries = [(start[0], end[0])] + [tuple(names[k] for k in rng.choice(len(names), 2, replace=False))
+                                              for _ in range(n_queries - 1)]
+
+            def route(g, find_path):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    return [find_path(g, a, b) for a, b in queries]
+
+            record("find_shortest_path_Dijkstra", n_catalog, epoch_label,
+                   _measure(grid_graph, lambda g: route(g, SatelliteGraph.find_shortest_path_Dijkstra), repeat),
+                   len(queries), "percorsi/s")
+            record("find_shortest_path_minHop", n_catalog, epoch_label,
+                   _measure(grid_graph, lambda g: route(g, SatelliteGraph.find_shortest_path_minHop), repeat),
+                   len(queries), "percorsi/s")
+
+            routed = route(sat_graph, SatelliteGraph.find_shortest_path_Dijkstra)
+            paths = [result[0] for result in routed if result and result[0] and len(result[0]) > 1]
+            record("calculate_total_latency", n_catalog, epoch_label,
+                   _measure(lambda: (), lambda: [sat_graph.calculate_total_latency(path, CITY1, CITY2, load_factor)
+                                                 for path in paths], repeat),
+                   len(paths), "percorsi/s")
+
+            G = sat_graph.get_graph()
+            path_d = routed[0][0] if routed[0] else None
+            if not render_warmed_up:
+                # La prima figura costruisce la Basemap in cache, come il primo snapshot di una simulazione
+                _render(G, start, end, path_d, None, dpi)
+                render_warmed_up = True
+            record("render", n_catalog, epoch_label,
+                   _measure(lambda: (), lambda: _render(G, start, end, path_d, None, dpi), repeat),
+                   G.number_of_edges(), "archi/s")
+
+    return _compare_with_baseline(results, baseline, threshold, min_delta_s, update_baseline)
+
+
+def _measure(setup, stage, repeat):
+    """
+    Tempo minimo (s) di stage(*setup()) su repeat esecuzioni, con setup fuori
+    dal tempo, e picco di memoria (MB) di un'ulteriore esecuzione con tracemalloc.
+    """
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            args = setup()
+            t0 = time.perf_counter()
+            stage(*args)
+            times.append(time.perf_counter() - t0)
+        args = setup()
+        tracemalloc.start()
+        stage(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return min(times), peak / 1e6
+
+
+def _compare_with_baseline(results, baseline, threshold, min_delta_s, update_baseline):
+    reference = {}
+    if os.path.exists(baseline) and not update_baseline:
+        with open(baseline) as f:
+            reference = json.load(f)['results']
+
+    print(f"\nStadi della pipeline (soglia di regressione +{threshold:.0%})")
+    print(f"{'Stadio':<28} {'Catalogo':>8} {'Epoca':<21} {'Tempo (s)':>10} {'Picco (MB)':>11} "
+          f"{'Throughput':>22} {'Baseline (s)':>13} Esito")
+    regressions = 0
+    for key, result in results.items():
+        base = reference.get(key)
+        if base is None:
+            status, base_wall = "nuovo" if reference else "-", "-"
+        else:
+            base_wall = f"{base['wall_s']:.4f}"
+            change = result['wall_s'] / base['wall_s'] - 1 if base['wall_s'] > 0 else 0.0
+            if change > threshold and result['wall_s'] - base['wall_s'] > min_delta_s:
+                status = f"REGRESSIONE {change:+.0%}"
+                regressions += 1
+            else:
+                status = f"ok {change:+.0%}"
+        throughput = f"{result['throughput']:>10.1f} {result['unit']:<11}"
+        print(f"{result['stage']:<28} {result['catalog']:>8} {result['epoch']:<21} {result['wall_s']:>10.4f} "
+              f"{result['peak_mb']:>11.2f} {throughput:>22} {base_wall:>13} {status}")
+
+    if not reference:
+        with open(baseline, "w") as f:
+            json.dump({'created': time.strftime("%Y-%m-%dT%H:%M:%S"), 'results': results}, f, indent=1)
+        print(f"Baseline salvata in {baseline}")
+    elif regressions:
+        print(f"{regressions} stadi più lenti della baseline oltre la soglia")
+    return regressions
+
+
+def _route(find_path, source, target):
+    try:
+        return find_path(source, target)
+    except nx.NetworkXNoPath:
+        return None
+
+
+BENCHMARKS = {
+    'filter_satellites': benchmark_filter_satellites,
+    'satellite_records': benchmark_satellite_records,
+    'connect_nodes': benchmark_connect_nodes,
+    'plus_grid': benchmark_plus_grid,
+    'min_degree_repair': benchmark_min_degree_repair,
+    'ground_access': benchmark_ground_access,
+    'city_matrix': benchmark_city_matrix,
+    'routing': benchmark_routing,
+    'temporal_routing': benchmark_temporal_routing,
+    'temporal_routing_check': benchmark_temporal_routing_check,
+    'render_map': benchmark_render_map,
+    'stages': benchmark_stages,
+}
+
+
+if __name__ == "__main__":
+    # Uso: python benchmark.py [nome ...] (senza argomenti li esegue tutti)
+    # Opzioni della suite per stadi: --baseline FILE, --threshold FRAZIONE, --update-baseline
+    args = sys.argv[1:]
+    stage_options = {}
+    for option, key, convert in (('--baseline', 'baseline', str), ('--threshold', 'threshold', float)):
+        if option in args:
+            position = args.index(option)
+            stage_options[key] = convert(args[position + 1])
+            del args[position:position + 2]
+    if '--update-baseline' in args:
+        args.remove('--update-baseline')
+        stage_options['update_baseline'] = True
+
+    regressions = 0
+    for name in args or BENCHMARKS:
+        if name == 'stages':
+            regressions = BENCHMARKS[name](**stage_options)
+        else:
+            BENCHMARKS[name]()
+    sys.exit(1 if regressions else 0)
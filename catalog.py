@@ -0,0 +1,141 @@
+import glob
+import hashlib
+import os
+
+import numpy as np
+from sgp4.api import Satrec, WGS72
+from skyfield.api import load, EarthSatellite
+from skyfield.timelib import compute_calendar_date
+
+# Cartella della cache binaria dei cataloghi TLE (accanto al file TLE)
+CACHE_DIR_NAME = ".tle_cache"
+
+# Elementi orbitali salvati nella cache, nell'ordine richiesto da sgp4init
+ELEMENT_FIELDS = ['satnum', 'epoch', 'bstar', 'ndot', 'nddot', 'ecco',
+                  'argpo', 'inclo', 'mo', 'no_kozai', 'nodeo']
+
+# Giorno giuliano dell'epoca usata da sgp4init (1949-12-31 00:00 UT)
+SGP4INIT_EPOCH_JD = 2433281.5
+
+_timescale = None
+_catalogs = {}  # percorso assoluto -> (hash del contenuto, lista di EarthSatellite)
+
+# Contatori osservabili dall'esterno (es. nei test o nei benchmark)
+cache_stats = {
+    'memory_hits': 0,    # catalogo già in memoria nel processo
+    'disk_hits': 0,      # catalogo letto dalla cache binaria su disco
+    'misses': 0,         # catalogo ricavato dal parsing del file di testo
+    'invalidations': 0,  # cache scartate perché il file TLE è cambiato
+}
+
+
+def get_timescale():
+    """Restituisce la Timescale di Skyfield, creata una sola volta per processo."""
+    global _timescale
+    if _timescale is None:
+        _timescale = load.timescale()
+    return _timescale
+
+
+def file_hash(tle_file):
+    with open(tle_file, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def cache_path(tle_file, content_hash):
+    folder = os.path.join(os.path.dirname(os.path.abspath(tle_file)), CACHE_DIR_NAME)
+    return os.path.join(folder, f"{os.path.basename(tle_file)}.{content_hash[:16]}.npz")
+
+
+def load_satellites(tle_file="gp.txt", use_disk_cache=True):
+    """
+    Restituisce la lista di EarthSatellite del file TLE.
+    Il file viene letto una sola volta per processo e gli stessi oggetti sono
+    condivisi da tutti i tracker; tra un'esecuzione e l'altra si usa una cache
+    binaria su disco indicizzata dall'hash del contenuto del file.
+    """
+    path = os.path.abspath(tle_file)
+    content_hash = file_hash(path)
+
+    cached = _catalogs.get(path)
+    if cached is not None and cached[0] == content_hash:
+        cache_stats['memory_hits'] += 1
+        return cached[1]
+    if cached is not None:
+        cache_stats['invalidations'] += 1
+        print(f"File TLE modificato, catalogo in memoria invalidato: {tle_file}")
+
+    ts = get_timescale()
+    npz_file = cache_path(path, content_hash)
+    if use_disk_cache and os.path.exists(npz_file):
+        satellites = _read_cache(npz_file, ts)
+        cache_stats['disk_hits'] += 1
+        print(f"Catalogo TLE letto dalla cache: {npz_file}")
+    else:
+        satellites = load.tle_file(path, ts=ts)
+        cache_stats['misses'] += 1
+        print(f"Catalogo TLE letto dal file di testo: {tle_file}")
+        if use_disk_cache:
+            _remove_stale_caches(path, npz_file)
+            _write_cache(npz_file, satellites)
+
+    _catalogs[path] = (content_hash, satellites)
+    return satellites
+
+
+def clear_memory_cache():
+    _catalogs.clear()
+
+
+def _remove_stale_caches(path, npz_file):
+    pattern = cache_path(path, '*')
+    for old_file in glob.glob(pattern):
+        if old_file != npz_file:
+            os.remove(old_file)
+            cache_stats['invalidations'] += 1
+            print(f"Cache TLE obsoleta rimossa: {old_file}")
+
+
+def _write_cache(npz_file, satellites):
+    os.makedirs(os.path.dirname(npz_file), exist_ok=True)
+    elements = {field: [] for field in ELEMENT_FIELDS}
+    for sat in satellites:
+        model = sat.model
+        epoch = model.jdsatepoch - SGP4INIT_EPOCH_JD + model.jdsatepochF
+        for field in ELEMENT_FIELDS:
+            elements[field].append(epoch if field == 'epoch' else getattr(model, field))
+
+    tmp_file = npz_file + ".tmp.npz"
+    np.savez(tmp_file,
+             names=np.array([sat.name or '' for sat in satellites]),
+             **{field: np.array(values) for field, values in elements.items()})
+    os.replace(tmp_file, npz_file)
+
+
+def _read_cache(npz_file, ts):
+    data = np.load(npz_file)
+    names = data['names'].tolist()
+    columns = [data[field].tolist() for field in ELEMENT_FIELDS]
+
+    satrecs = []
+    for values in zip(*columns):
+        satrec = Satrec()
+        satrec.sgp4init(WGS72, 'i', *values)
+        satrecs.append(satrec)
+
+    # Epoche calcolate tutte insieme, come in EarthSatellite.from_satrec()
+    jd = np.array([satrec.jdsatepoch for satrec in satrecs])
+    jd_fraction = np.array([satrec.jdsatepochF for satrec in satrecs])
+    whole, fraction = np.divmod(jd, 1.0)
+    year, month, day = compute_calendar_date(whole.astype(int))
+    epochs = ts.utc(year, month, day + 0.5 + fraction + jd_fraction)
+
+    satellites = []
+    for i, (name, satrec) in enumerate(zip(names, satrecs)):
+        sat = EarthSatellite.__new__(EarthSatellite)
+        sat.model = satrec
+        sat.name = name or None
+        sat.epoch = ts.tt_jd(epochs.whole[i], epochs.tt_fraction[i])
+        sat._setup(satrec)
+        satellites.append(sat)
+    return satellites
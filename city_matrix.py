@@ -0,0 +1,76 @@
+import csv
+import os
+
+import numpy as np
+
+# Cartella predefinita delle matrici di latenza fra tutte le coppie di città
+CITY_MATRIX_DIR = "city_matrices"
+
+# Matrici N x N salvate per ogni snapshot (Dijkstra: _d, MinHop: _m)
+MATRIX_FIELDS = ('half_rtt_d', 'half_rtt_m', 'n_hops_d', 'n_hops_m', 'distance_d', 'distance_m')
+
+
+def save_city_matrix(filename, city_names, start_iso, range_value, plusGrid, access_nodes, matrices):
+    """
+    Salva in un .npz compresso le matrici di uno snapshot (RTT/2 in ms e
+    distanze in km come float32, hop come int16) con i nomi delle città, i
+    loro satelliti di accesso e le opzioni della simulazione.
+    """
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    arrays = {field: matrices[field].astype(np.int16 if field.startswith("n_hops") else np.float32)
+              for field in MATRIX_FIELDS}
+    np.savez_compressed(
+        filename,
+        city_names=np.array(city_names),
+        access_nodes=np.array(access_nodes),
+        start_time=np.array(start_iso),
+        range_value=np.array(range_value),
+        plusGrid=np.array(plusGrid),
+        **arrays,
+    )
+
+
+def load_city_matrix(filename):
+    """Rilegge uno snapshot salvato da save_city_matrix come dizionario di array."""
+    with np.load(filename) as data:
+        snapshot = {field: data[field] for field in MATRIX_FIELDS}
+        snapshot['city_names'] = data['city_names'].tolist()
+        snapshot['access_nodes'] = data['access_nodes'].tolist()
+        snapshot['start_time'] = str(data['start_time'])
+        snapshot['range_value'] = data['range_value'].item()
+        snapshot['plusGrid'] = bool(data['plusGrid'])
+    return snapshot
+
+
+def summarize_city_matrices(filenames, summary_file):
+    """
+    Media nel tempo delle matrici degli snapshot in filenames: per ogni
+    coppia la media sugli snapshot in cui le due città sono collegate e la
+    frazione di questi snapshot ('reachable'). Salva la sintesi in
+    summary_file (.npz) e, una riga per coppia, nel .csv con lo stesso nome;
+    restituisce il dizionario delle matrici medie.
+    """
+    snapshots = [load_city_matrix(filename) for filename in filenames]
+    city_names = snapshots[0]['city_names']
+    reachable = np.mean([snapshot['n_hops_d'] >= 0 for snapshot in snapshots], axis=0)
+    summary = {'reachable': reachable}
+    for field in MATRIX_FIELDS:
+        values = np.array([snapshot[field] for snapshot in snapshots], dtype=np.float64)
+        if field.startswith("n_hops"):
+            values[values < 0] = np.nan
+        # Le coppie mai collegate restano NaN (senza l'avviso di nanmean su colonne vuote)
+        connected = np.isfinite(values).sum(axis=0)
+        summary[field] = np.where(connected > 0, np.nansum(values, axis=0) / np.maximum(connected, 1), np.nan)
+
+    os.makedirs(os.path.dirname(summary_file) or ".", exist_ok=True)
+    np.savez_compressed(summary_file, city_names=np.array(city_names), n_snapshots=np.array(len(snapshots)),
+                        **summary)
+    with open(os.path.splitext(summary_file)[0] + ".csv", "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["city1", "city2", "reachable"] + list(MATRIX_FIELDS))
+        for i, city1 in enumerate(city_names):
+            for j, city2 in enumerate(city_names):
+                if i != j:
+                    writer.writerow([city1, city2, f"{reachable[i, j]:.3f}"]
+                                    + [f"{summary[field][i, j]:.3f}" for field in MATRIX_FIELDS])
+    return summary
@@ -0,0 +1,278 @@
+from heapq import heappush, heappop
+from itertools import count
+
+import networkx as nx
+import numpy as np
+
+import instrumentation
+
+# Attributi numerici dei nodi salvati come array contigui (None -> NaN o -1)
+FLOAT_FIELDS = ('lat', 'lon', 'alt', 'plane')
+INT_FIELDS = ('plane_index', 'sat_index_in_plane')
+
+
+class CSRGraph:
+    """
+    Grafo non orientato compatto: i nodi sono indici 0..n-1 con attributi in
+    array contigui, le adiacenze sono in formato CSR (indptr, indices) con i
+    pesi in un array float.
+    Dijkstra e la ricerca min-hop lavorano sugli array e, visitando i vicini
+    nello stesso ordine delle liste di adiacenza di NetworkX, restituiscono
+    gli stessi percorsi di nx.dijkstra_path e nx.shortest_path.
+    """
+
+    def __init__(self, names, node_arrays, xyz, indptr, indices, weights):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.node_arrays = node_arrays
+        self.xyz = xyz
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self._lists = None
+
+    @classmethod
+    def from_networkx(cls, G):
+        """Costruisce il grafo CSR mantenendo l'ordine dei nodi e delle adiacenze di G."""
+        names = list(G.nodes())
+        index = {name: i for i, name in enumerate(names)}
+        indptr = np.zeros(len(names) + 1, dtype=np.int64)
+        indices = []
+        weights = []
+        for i, name in enumerate(names):
+            for neighbor, data in G.adj[name].items():
+                indices.append(index[neighbor])
+                weights.append(data['weight'])
+            indptr[i + 1] = len(indices)
+
+        node_arrays, xyz = cls._node_arrays([G.nodes[name] for name in names])
+        return cls(names, node_arrays, xyz, indptr,
+                   np.array(indices, dtype=np.int32), np.array(weights, dtype=np.float64))
+
+    @classmethod
+    def from_edges(cls, names, nodes_data, i, j, weights):
+        """
+        Costruisce il grafo CSR dalla sequenza di archi (i, j): in ogni riga i
+        vicini compaiono nell'ordine della sequenza, cioè lo stesso ordine che
+        avrebbe NetworkX aggiungendo gli archi uno alla volta. Per le coppie
+        i < j ordinate come nel doppio ciclo i vicini risultano in ordine
+        crescente di indice.
+        """
+        i = np.asarray(i, dtype=np.int64)
+        j = np.asarray(j, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+        rows = np.concatenate([i, j])
+        cols = np.concatenate([j, i])
+        w = np.concatenate([weights, weights])
+        position = np.tile(np.arange(len(i)), 2)
+        order = np.lexsort((position, rows))
+        indptr = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(names)), out=indptr[1:])
+
+        node_arrays, xyz = cls._node_arrays(nodes_data)
+        return cls(names, node_arrays, xyz, indptr,
+                   cols[order].astype(np.int32), w[order].astype(np.float64))
+
+    @staticmethod
+    def _node_arrays(nodes_data):
+        node_arrays = {}
+        for field in FLOAT_FIELDS:
+            node_arrays[field] = np.array([np.nan if data.get(field) is None else data[field]
+                                           for data in nodes_data], dtype=np.float64)
+        for field in INT_FIELDS:
+            node_arrays[field] = np.array([-1 if data.get(field) is None else data[field]
+                                           for data in nodes_data], dtype=np.int32)
+        xyz = np.array([data['xyz'] for data in nodes_data], dtype=np.float64).reshape(-1, 3)
+        return node_arrays, xyz
+
+    def number_of_nodes(self):
+        return len(self.names)
+
+    def number_of_edges(self):
+        return len(self.indices) // 2
+
+    def nbytes(self):
+        # Memoria occupata dagli array del grafo (esclusi i nomi)
+        arrays = [self.xyz, self.indptr, self.indices, self.weights] + list(self.node_arrays.values())
+        return sum(array.nbytes for array in arrays)
+
+    def _adjacency_lists(self):
+        # Liste Python delle adiacenze, più rapide degli array NumPy negli accessi scalari
+        if self._lists is None:
+            self._lists = (self.indptr.tolist(), self.indices.tolist(), self.weights.tolist())
+        return self._lists
+
+    def edge_weight(self, u, v):
+        """Peso dell'arco (u, v) per nome dei nodi, None se l'arco non esiste."""
+        indptr, indices, weights = self._adjacency_lists()
+        a = self.index[u]
+        b = self.index[v]
+        for k in range(indptr[a], indptr[a + 1]):
+            if indices[k] == b:
+                return weights[k]
+        return None
+
+    def path_distance(self, path):
+        return sum(self.edge_weight(path[i], path[i + 1]) for i in range(len(path) - 1))
+
+    def dijkstra_path(self, source, target):
+        """Cammino minimo pesato da source a target (nomi dei nodi)."""
+        t = self.index[target]
+        dist, pred = self._dijkstra(self.index[source], t)
+        if t not in dist:
+            raise nx.NetworkXNoPath(f"Node {target} not reachable from {source}")
+        return self._build_path(pred, t)
+
+    def dijkstra_tree(self, source):
+        """
+        Albero dei cammini minimi da source verso tutti i nodi raggiungibili:
+        restituisce (dist, pred) indicizzati per indice dei nodi. Il cammino
+        verso ogni nodo (tree_path) coincide con quello di dijkstra_path.
+        """
+        return self._dijkstra(self.index[source])
+
+    def bfs_tree(self, source):
+        """
+        Albero dei cammini con il minor numero di hop da source verso tutti i
+        nodi raggiungibili, nello stesso formato di dijkstra_tree (numero di
+        hop e predecessori). I vicini sono visitati nell'ordine delle liste di
+        adiacenza, così i cammini coincidono con quelli di
+        nx.single_source_shortest_path.
+        """
+        indptr, indices, _ = self._adjacency_lists()
+        s = self.index[source]
+        hops = {s: 0}
+        pred = {s: None}
+        this_level = [s]
+        level = 0
+        while this_level:
+            level += 1
+            next_level = []
+            for v in this_level:
+                for w in indices[indptr[v]:indptr[v + 1]]:
+                    if w not in hops:
+                        hops[w] = level
+                        pred[w] = v
+                        next_level.append(w)
+            this_level = next_level
+        return hops, pred
+
+    def tree_path(self, tree, target):
+        """Cammino verso target estratto da un albero di dijkstra_tree, None se irraggiungibile."""
+        dist, pred = tree
+        t = self.index[target]
+        if t not in dist:
+            return None
+        return self._build_path(pred, t)
+
+    def _dijkstra(self, s, t=None):
+        # Stesso ordine di visita di NetworkX; con t=None esplora tutto il grafo
+        indptr, indices, weights = self._adjacency_lists()
+        dist = {}
+        seen = {s: 0}
+        pred = {s: None}
+        c = count()
+        fringe = [(0, next(c), s)]
+        while fringe:
+            dist_v, _, v = heappop(fringe)
+            if v in dist:
+                continue
+            dist[v] = dist_v
+            if v == t:
+                break
+            for k in range(indptr[v], indptr[v + 1]):
+                u = indices[k]
+                if u in dist:
+                    continue
+                vu_dist = dist_v + weights[k]
+                if u not in seen or vu_dist < seen[u]:
+                    seen[u] = vu_dist
+                    heappush(fringe, (vu_dist, next(c), u))
+                    pred[u] = v
+        instrumentation.count("dijkstra_nodes_settled", len(dist))
+        return dist, pred
+
+    def shortest_path(self, source, target):
+        """
+        Cammino con il minor numero di hop, con la stessa BFS bidirezionale
+        di nx.shortest_path (espande ogni volta la frontiera più piccola).
+        """
+        indptr, indices, _ = self._adjacency_lists()
+        s = self.index[source]
+        t = self.index[target]
+        if s == t:
+            return [source]
+
+        pred = {s: None}
+        succ = {t: None}
+        forward_fringe = [s]
+        reverse_fringe = [t]
+        while forward_fringe and reverse_fringe:
+            if len(forward_fringe) <= len(reverse_fringe):
+                this_level = forward_fringe
+                forward_fringe = []
+                for v in this_level:
+                    for w in indices[indptr[v]:indptr[v + 1]]:
+                        if w not in pred:
+                            forward_fringe.append(w)
+                            pred[w] = v
+                        if w in succ:
+                            return self._join_path(pred, succ, w)
+            else:
+                this_level = reverse_fringe
+                reverse_fringe = []
+                for v in this_level:
+                    for w in indices[indptr[v]:indptr[v + 1]]:
+                        if w not in succ:
+                            succ[w] = v
+                            reverse_fringe.append(w)
+                        if w in pred:
+                            return self._join_path(pred, succ, w)
+
+        raise nx.NetworkXNoPath(f"No path between {source} and {target}.")
+
+    def _build_path(self, pred, node):
+        path = []
+        while node is not None:
+            path.append(self.names[node])
+            node = pred[node]
+        path.reverse()
+        return path
+
+    def _join_path(self, pred, succ, w):
+        path = self._build_path(pred, w)
+        node = succ[w]
+        while node is not None:
+            path.append(self.names[node])
+            node = succ[node]
+        return path
+
+    def node_data(self, i):
+        # Attributi del nodo i come in SatelliteGraph._node_data (NaN e -1 tornano None)
+        data = {'name': self.names[i]}
+        for field in FLOAT_FIELDS:
+            value = self.node_arrays[field][i]
+            data[field] = None if np.isnan(value) else value
+        for field in INT_FIELDS:
+            value = int(self.node_arrays[field][i])
+            data[field] = None if value < 0 else value
+        data['xyz'] = self.xyz[i]
+        return data
+
+    def to_networkx(self):
+        """
+        Esporta il grafo in NetworkX (es. per la visualizzazione), con gli
+        stessi attributi dei nodi di SatelliteGraph e lo stesso ordine di G.edges().
+        """
+        G = nx.Graph()
+        for i, name in enumerate(self.names):
+            G.add_node(name, **self.node_data(i))
+
+        indptr, indices, weights = self._adjacency_lists()
+        for a, name in enumerate(self.names):
+            for k in range(indptr[a], indptr[a + 1]):
+                b = indices[k]
+                # Ogni arco viene aggiunto una sola volta, dal nodo con indice minore
+                if b > a:
+                    G.add_edge(name, self.names[b], weight=self.weights[k])
+        return G
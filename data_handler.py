@@ -1,76 +1,158 @@
 import csv
+import json
 import os
+import sqlite3
 import matplotlib.pyplot as plt
 
+import instrumentation
 import utils
 
 
-class DataHandler:
-    def __init__(self):
-        self.results = []  # risultati per ogni simulazione (valori singoli)
-        self.avg_results = []  # risultati medi aggregati per ogni valore di LISL_range
-
-        self.rtt_d_list = []
-        self.rtt_m_list = []
-        self.half_rtt_d_list = []
-        self.half_rtt_m_list = []
-        self.n_hops_d_list = []
-        self.n_hops_m_list = []
-        self.distance_d_list = []
-        self.distance_m_list = []
-
-        self.avg_rtt_d_list = []
-        self.avg_half_rtt_d_list = []
-        self.avg_rtt_m_list = []
-        self.avg_half_rtt_m_list = []
-        self.avg_n_hops_d_list = []
-        self.avg_n_hops_m_list = []
-        self.avg_distance_d_list = []
-        self.avg_distance_m_list = []
-
-        self.dict_results_d = []
-        self.dict_results_m = []
-
-        self.dict_distance_d = {}
-        self.dict_distance_m = {}
-
-
-    def add_result(self, range, n_hop_d, n_hop_m, half_rtt_d, half_rtt_m, distance_d,
-                   distance_m):
-
-        self.half_rtt_d_list.append(half_rtt_d)
-        self.half_rtt_m_list.append(half_rtt_m)
-        self.n_hops_d_list.append(n_hop_d)
-        self.n_hops_m_list.append(n_hop_m)
-        self.distance_d_list.append(distance_d)
-        self.distance_m_list.append(distance_m)
-
-        self.dict_distance_d = {
-            "Range": range,
-            "Distance" : distance_d
-        }
-
-        self.dict_distance_m = {
-            "Range": range,
-            "Distance": distance_m
-        }
+# Un record per snapshot e algoritmo; la chiave primaria e gli indici coprono le
+# colonne su cui si filtrano e si aggregano i risultati
+RESULTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    city1 TEXT NOT NULL,
+    city2 TEXT NOT NULL,
+    start_time TEXT NOT NULL,
+    lisl_range NUMERIC NOT NULL,
+    topology TEXT NOT NULL,
+    load_factor REAL NOT NULL,
+    algorithm TEXT NOT NULL,
+    n_hops INTEGER,
+    half_rtt REAL,
+    distance REAL,
+    path TEXT,
+    PRIMARY KEY (city1, city2, start_time, lisl_range, topology, load_factor, algorithm)
+);
+CREATE INDEX IF NOT EXISTS {table}_by_range
+    ON {table} (city1, city2, topology, load_factor, algorithm, lisl_range, start_time);
+CREATE INDEX IF NOT EXISTS {table}_by_time ON {table} (start_time);
+"""
+
+# Tabelle con lo schema RESULTS_SCHEMA: snapshot del Test 1 (LISL_range variabile)
+# e del Test 2 (RTT verso più città con LISL fisso)
+RESULTS_TABLES = ("snapshots", "rtt_snapshots")
+
+# Colonne dei valori aggregabili di un record
+RESULT_COLUMNS = ("n_hops", "half_rtt", "distance")
+
+
+class ResultsStore:
+    """
+    Risultati di ogni snapshot in un database SQLite locale: ogni record viene
+    scritto appena prodotto e medie e distribuzioni si ottengono con query,
+    filtrando per coppia di città, intervallo di tempo, LISL_range, topologia,
+    fattore di carico e algoritmo. Un record già presente con la stessa chiave
+    viene sostituito, così ripetere una simulazione non duplica i risultati.
+    Ogni metodo lavora sulla tabella table (una di RESULTS_TABLES).
+    """
+
+    def __init__(self, path="results.db"):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        for table in RESULTS_TABLES:
+            self.conn.executescript(RESULTS_SCHEMA.format(table=table))
+
+    @instrumentation.timed("store_results")
+    def add_snapshot(self, city1, city2, start_time, LISL_range, topology, load_factor, records, table="snapshots"):
+        # records: lista di (algoritmo, n_hops, half_rtt, distance, percorso)
+        self._check_table(table)
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(city1, city2, start_time, LISL_range, topology, load_factor, algorithm, n_hops, half_rtt, distance,
+              json.dumps(path)) for algorithm, n_hops, half_rtt, distance, path in records])
+        self.conn.commit()
+
+    @staticmethod
+    def _check_table(table):
+        if table not in RESULTS_TABLES:
+            raise ValueError(f"Tabella non valida: {table}")
+
+    @staticmethod
+    def _where(filters):
+        # Condizioni WHERE dai filtri non None; start_time accetta una coppia (primo, ultimo) inclusiva
+        conditions, params = [], []
+        for column, value in filters.items():
+            if value is None:
+                continue
+            if column == "start_time":
+                conditions.append("start_time BETWEEN ? AND ?")
+                params += list(value)
+            elif isinstance(value, (list, tuple)):
+                conditions.append(f"{column} IN ({', '.join('?' * len(value))})")
+                params += list(value)
+            else:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        return (" WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    def averages(self, column, table="snapshots", **filters):
+        """Media di column per LISL_range sui record selezionati: {LISL_range: media}."""
+        if column not in RESULT_COLUMNS:
+            raise ValueError(f"Colonna non valida: {column}")
+        self._check_table(table)
+        where, params = self._where(filters)
+        rows = self.conn.execute(
+            f"SELECT lisl_range, AVG({column}) FROM {table}{where} GROUP BY lisl_range", params)
+        return dict(rows.fetchall())
+
+    def values(self, column, table="snapshots", **filters):
+        """Valori di column per LISL_range in ordine di tempo: {LISL_range: [valori]}."""
+        if column not in RESULT_COLUMNS:
+            raise ValueError(f"Colonna non valida: {column}")
+        self._check_table(table)
+        where, params = self._where(filters)
+        values = {}
+        for LISL_range, value in self.conn.execute(
+                f"SELECT lisl_range, {column} FROM {table}{where} ORDER BY lisl_range, start_time", params):
+            values.setdefault(LISL_range, []).append(value)
+        return values
+
+    def paths(self, table="snapshots", **filters):
+        """Percorsi dei record selezionati: lista di (start_time, LISL_range, algoritmo, percorso)."""
+        self._check_table(table)
+        where, params = self._where(filters)
+        rows = self.conn.execute(
+            f"SELECT start_time, lisl_range, algorithm, path FROM {table}{where} "
+            f"ORDER BY start_time, lisl_range, algorithm", params)
+        return [(start_time, LISL_range, algorithm, json.loads(path))
+                for start_time, LISL_range, algorithm, path in rows]
+
+    def close(self):
+        self.conn.close()
 
-        self.dict_results_d.append(self.dict_distance_d)
-        self.dict_results_m.append(self.dict_distance_m)
 
+class DataHandler:
+    def __init__(self, results_db="results.db"):
+        self.store = ResultsStore(results_db)
+        # Filtri della simulazione corrente per le query (impostati da select)
+        self.selection = {}
+        self.LISL_range = []
+        self.avg_results = []  # risultati medi aggregati per ogni valore di LISL_range
 
-    def reset_avg_values(self):
-        self.rtt_d_list = []
-        self.rtt_m_list = []
-        self.half_rtt_d_list = []
-        self.half_rtt_m_list = []
-        self.n_hops_d_list = []
-        self.n_hops_m_list = []
-        self.distance_d_list = []
-        self.distance_m_list = []
-
-    def reset_rtt_values(self):
-        self.rtt_d_list = []
+    def select(self, city1, city2, topology, load_factor, start_times, LISL_range):
+        # Limita medie e grafici ai record della simulazione corrente
+        # (start_times: primo e ultimo istante; LISL_range: range della simulazione)
+        self.selection = {"city1": city1, "city2": city2, "topology": topology, "load_factor": load_factor,
+                          "start_time": (start_times[0], start_times[-1])}
+        self.LISL_range = list(LISL_range)
+
+    def add_result(self, city1, city2, start_time, range, topology, load_factor, n_hop_d, n_hop_m,
+                   half_rtt_d, half_rtt_m, distance_d, distance_m, path_d=None, path_m=None):
+        self.store.add_snapshot(city1, city2, start_time, range, topology, load_factor, [
+            ("Dijkstra", n_hop_d, half_rtt_d, distance_d, path_d),
+            ("MinHop", n_hop_m, half_rtt_m, distance_m, path_m),
+        ])
+
+    def get_averages(self, column, algorithm, LISL_range):
+        # Medie della simulazione corrente nell'ordine di LISL_range
+        averages = self.store.averages(column, algorithm=algorithm, lisl_range=list(LISL_range), **self.selection)
+        return [averages[range_value] for range_value in LISL_range]
+
+    def get_values(self, column, algorithm):
+        # Valori per snapshot della simulazione corrente raggruppati per LISL_range
+        return self.store.values(column, algorithm=algorithm, lisl_range=list(self.LISL_range), **self.selection)
 
     def add_avg_result(self, city1, city2, LISL_range, avg_n_hop_d, avg_n_hop_m,
                        avg_half_rtt_d, avg_half_rtt_m,
@@ -88,25 +170,18 @@ class DataHandler:
             "Distance totale media MinHop": utils.round_sig(avg_distance_m, 6)
         }
         self.avg_results.append(avg_result)
-        self.avg_half_rtt_d_list.append(avg_half_rtt_d)
-        self.avg_half_rtt_m_list.append(avg_half_rtt_m)
-        self.avg_n_hops_d_list.append(avg_n_hop_d)
-        self.avg_n_hops_m_list.append(avg_n_hop_m)
-        self.avg_distance_d_list.append(avg_distance_d)
-        self.avg_distance_m_list.append(avg_distance_m)
 
-
-    def add_rtt_value(self, value):
-        self.rtt_d_list.append(value)
+    def add_rtt_value(self, city1, city2, start_time, LISL_range, topology, load_factor, rtt, n_hops, distance,
+                      path=None):
+        # RTT (ms) Dijkstra di uno snapshot del Test 2, salvato come RTT/2 come i record del Test 1
+        self.store.add_snapshot(city1, city2, start_time, LISL_range, topology, load_factor,
+                                [("Dijkstra", n_hops, rtt / 2, distance, path)], table="rtt_snapshots")
 
     def get_rtt_values(self):
-        return self.rtt_d_list
-
-    def get_results_lists(self):
-        return (self.rtt_d_list, self.half_rtt_d_list,
-                self.rtt_m_list, self.half_rtt_m_list,
-                self.n_hops_d_list, self.n_hops_m_list,
-                self.distance_d_list, self.distance_m_list)
+        # RTT (ms) degli snapshot della simulazione corrente in ordine di tempo
+        values = self.store.values("half_rtt", table="rtt_snapshots", algorithm="Dijkstra",
+                                   lisl_range=list(self.LISL_range), **self.selection)
+        return [2 * half_rtt for range_value in self.LISL_range for half_rtt in values.get(range_value, [])]
 
     def save_results_to_csv(self, filename):
         file_exists = os.path.exists(filename)
@@ -159,6 +234,6 @@ class DataHandler:
             for u, v, data in graph.edges(data=True):
                 writer.writerow([u, v, data["weight"]])
 
-    def save_map_as_png(filename="map.png"):
-        plt.savefig(filename, dpi=600, bbox_inches='tight')
+    def save_map_as_png(filename="map.png", dpi=600):
+        plt.savefig(filename, dpi=dpi, bbox_inches='tight')
         print(f"Mappa salvata come {filename}")
\ No newline at end of file
@@ -0,0 +1,105 @@
+import os
+from datetime import timedelta
+
+import numpy as np
+from skyfield.constants import DAY_S
+
+import catalog
+from propagation import propagate_itrs
+
+# Cartella in cui vengono salvate le effemeridi precalcolate
+EPHEMERIS_DIR = ".ephemeris_cache"
+
+
+class EphemerisStore:
+    """
+    Posizioni ITRS (km, float32) di tutto il catalogo TLE campionate a passo
+    costante su un orizzonte di simulazione. L'array ha forma
+    (n_istanti, n_satelliti, 3): la finestra di una simulazione è quindi un
+    blocco contiguo, leggibile direttamente dal file memory-mapped.
+    """
+
+    def __init__(self, satellites, start_time, step_s, positions, npy_file=None, tle_file="gp.txt"):
+        self.satellites = satellites
+        self.start_time = start_time
+        self.step_s = step_s
+        self.positions = positions
+        self.npy_file = npy_file
+        self.tle_file = tle_file
+
+    def __getstate__(self):
+        # Verso i processi worker si passano solo i riferimenti ai file:
+        # il catalogo e il memmap vengono riaperti nel processo di destinazione
+        return {
+            'npy_file': self.npy_file,
+            'tle_file': self.tle_file,
+            'start_jd': (self.start_time.whole, self.start_time.tt_fraction),
+            'step_s': self.step_s,
+        }
+
+    def __setstate__(self, state):
+        self.npy_file = state['npy_file']
+        self.tle_file = state['tle_file']
+        self.start_time = catalog.get_timescale().tt_jd(*state['start_jd'])
+        self.step_s = state['step_s']
+        self.satellites = catalog.load_satellites(self.tle_file)
+        self.positions = np.load(self.npy_file, mmap_mode='r')
+
+    @classmethod
+    def load_or_build(cls, start_time, duration=timedelta(minutes=90), step=timedelta(seconds=1),
+                      tle_file="gp.txt", folder=EPHEMERIS_DIR):
+        """
+        Apre le effemeridi da disco (memory-mapped) se esistono per lo stesso
+        catalogo, istante iniziale, passo e durata; altrimenti le calcola
+        propagando il catalogo una sola volta e le salva.
+        """
+        ts = catalog.get_timescale()
+        satellites = catalog.load_satellites(tle_file)
+        step_s = step.total_seconds()
+        n_times = int(round(duration.total_seconds() / step_s)) + 1
+
+        key = "{}_{}_{:.9f}_{}_{}.npy".format(
+            os.path.basename(tle_file), catalog.file_hash(tle_file)[:16],
+            start_time.tt, step_s, n_times)
+        npy_file = os.path.join(folder, key)
+
+        if os.path.exists(npy_file):
+            print(f"Effemeridi lette da disco: {npy_file}")
+            positions = np.load(npy_file, mmap_mode='r')
+            return cls(satellites, start_time, step_s, positions, npy_file, tle_file)
+
+        print(f"Calcolo effemeridi: {len(satellites)} satelliti x {n_times} istanti")
+        os.makedirs(folder, exist_ok=True)
+        t = ts.tt_jd(start_time.whole, start_time.tt_fraction + np.arange(n_times) * step_s / DAY_S)
+
+        tmp_file = npy_file + ".tmp"
+        positions = np.lib.format.open_memmap(tmp_file, mode='w+', dtype=np.float32,
+                                              shape=(n_times, len(satellites), 3))
+        propagate_itrs(satellites, t, out=positions.transpose(1, 0, 2))
+        positions.flush()
+        del positions
+        os.replace(tmp_file, npy_file)
+
+        positions = np.load(npy_file, mmap_mode='r')
+        return cls(satellites, start_time, step_s, positions, npy_file, tle_file)
+
+    def index_of(self, t):
+        """Indice del campione corrispondente all'istante t."""
+        k = (t - self.start_time) * DAY_S / self.step_s
+        index = int(round(k))
+        if abs(k - index) > 1e-3 or not (0 <= index < len(self.positions)):
+            raise ValueError(f"Istante {t.utc_iso()} non presente nelle effemeridi")
+        return index
+
+    def window(self, start_time, end_time, indices=None):
+        """
+        Posizioni ITRS (n_satelliti, n_istanti, 3) in float64 per tutti i
+        campioni tra start_time ed end_time compresi; con indices solo per
+        i satelliti indicati, nell'ordine di indices.
+        """
+        first = self.index_of(start_time)
+        last = self.index_of(end_time)
+        positions = self.positions[first:last + 1]
+        if indices is not None:
+            positions = positions[:, indices]
+        return np.asarray(positions, dtype=np.float64).transpose(1, 0, 2)
@@ -1,156 +1,345 @@
-from collections import defaultdict
+from itertools import chain
+
 import networkx as nx
+import numpy as np
 
+import instrumentation
+from csr_graph import CSRGraph
+from propagation import itrs_to_geodetic
+from satellite_table import PlaneGrid
 from utils import latency_calculation
-from utils import euclidean_distance
+from utils import cartesian_distance
+from utils import pairs_within_range
+from utils import nearest_neighbors
+
+# Vicini più prossimi cercati per ogni nodo da riparare in connect_nodes_hybrid
+REPAIR_NEIGHBORS = 16
+
 
 class SatelliteGraph:
-    def __init__(self, LISL_range):
+    def __init__(self, LISL_range, backend="networkx"):
         self.G = nx.Graph()
         self.LISL_range = LISL_range
-
+        # backend "networkx": archi e instradamento su self.G;
+        # backend "csr": instradamento su un CSRGraph compatto (vedi csr_graph.py)
+        self.backend = backend
+        self.csr = None
+        self._edges_only_in_csr = False
+        # Indice (plane_index, sat_index_in_plane) -> nodo per la topologia +Grid
+        self.plane_grid = None
+
+    @instrumentation.timed("add_nodes")
     def add_nodes(self, satellites):
+        # L'indice dei piani del tracker vale solo se i nodi sono esattamente questi satelliti
+        self.plane_grid = getattr(satellites, 'plane_grid', None) if self.G.number_of_nodes() == 0 else None
         for sat in satellites:
-            # Calcola la latitudine e la longitudine media dal track
-            mid_lat = (sat['track'][0][0] + sat['track'][-1][0]) / 2
-            mid_lon = (sat['track'][0][1] + sat['track'][-1][1]) / 2
-            # L'orbital_plane è memorizzato in sat['plane']
-            orbital_plane = sat.get('plane')
-            plane_index = sat.get('plane_index', None)
-            sat_index_in_plane = sat.get('sat_index_in_plane', None)
-
-            sat_data = {
-                'name': sat['name'],
-                'lat': mid_lat,
-                'lon': mid_lon,
-                'alt': sat['track'][-1][2],
-                'plane': orbital_plane,
-                'plane_index': plane_index,
-                'sat_index_in_plane': sat_index_in_plane,
-            }
-            self.G.add_node(sat['name'], **sat_data)
-
-    def _try_add_edge(self, node_a, node_b):
+            self.G.add_node(sat['name'], **self._node_data(sat))
+
+    @staticmethod
+    def _node_data(sat):
+        # Posizione ECEF (km) a metà finestra, usata per tutte le distanze
+        xyz = np.asarray(sat['xyz'], dtype=np.float64)
+        # Latitudine, longitudine e altitudine della stessa posizione: quelle della
+        # SatelliteTable (longitudine nella convenzione del track) o calcolate da xyz
+        if 'lat' in sat:
+            lat, lon, alt = sat['lat'], sat['lon'], sat['alt']
+        else:
+            lat, lon, alt = (float(value) for value in itrs_to_geodetic(xyz))
+        # L'orbital_plane è memorizzato in sat['plane']
+        orbital_plane = sat.get('plane')
+        plane_index = sat.get('plane_index', None)
+        sat_index_in_plane = sat.get('sat_index_in_plane', None)
+
+        return {
+            'name': sat['name'],
+            'lat': lat,
+            'lon': lon,
+            'alt': alt,
+            'xyz': xyz,
+            'plane': orbital_plane,
+            'plane_index': plane_index,
+            'sat_index_in_plane': sat_index_in_plane,
+        }
+
+    def _try_add_edge(self, node_a, node_b, distance=None):
         # Aggiunge un arco fra node_a e node_b se la distanza è entro LISL_range
         if self.G.has_edge(node_a, node_b):
             return
-        sat_a = self.G.nodes[node_a]
-        sat_b = self.G.nodes[node_b]
-        distance = euclidean_distance(
-            sat_a['lat'], sat_a['lon'], sat_a['alt'],
-            sat_b['lat'], sat_b['lon'], sat_b['alt']
-        )
+        if distance is None:
+            distance = cartesian_distance(self.G.nodes[node_a]['xyz'], self.G.nodes[node_b]['xyz'])
         if distance <= self.LISL_range:
             self.G.add_edge(node_a, node_b, weight=distance)
 
-    def _find_sat_by_index(self, sat_list, target_index):
-        """
-        Dato un elenco di satelliti (tupla (node_name, attrs)),
-        restituisce il satellite con sat_index_in_plane uguale a target_index.
-        """
-        for node_name, attrs in sat_list:
-            if attrs.get('sat_index_in_plane') == target_index:
-                return (node_name, attrs)
-        return None
-
-    def connect_nodes_plus_grid(self):
+    @instrumentation.timed("connect_nodes_plus_grid")
+    def connect_nodes_plus_grid(self, candidates=None):
         """
         Collega i satelliti secondo la topologia “+Grid”:
           - Connette il satellite al successivo e al precedente nello stesso piano.
-          - Connette il satellite a quello con lo stesso sat_index_in_plane nei piani adiacenti.
+          - Connette il satellite a quello con lo stesso sat_index_in_plane nei piani adiacenti
+            (l'ultimo piano è adiacente al piano 0, vedi PlaneGrid).
+        candidates (i, j, distanza) sono le coppie candidate già calcolate
+        (indici dei nodi, nell'ordine di _plus_grid_candidates), vedi LISLSweep.
         """
-        # Raggruppo i nodi per plane_index
-        plane_dict = defaultdict(list)
-        for node_name, attrs in self.G.nodes(data=True):
-            p_idx = attrs.get('plane_index')
-            if p_idx is not None:
-                plane_dict[p_idx].append((node_name, attrs))
-
-        # Ordino i satelliti in ogni piano per sat_index_in_plane
-        for p_idx in plane_dict:
-            plane_dict[p_idx].sort(key=lambda x: x[1].get('sat_index_in_plane', 0))
-
-        # ordino la lista dei piani
-        all_planes = sorted(plane_dict.keys())
-
-        # Per ogni piano, collega:
-        for p_idx in all_planes:
-            sat_list = plane_dict[p_idx]
-            for i, (node_name, attrs) in enumerate(sat_list):
-                # Collegamento all'interno dello stesso piano: collega al successivo e al precedente
-                if i > 0:
-                    prev_node, _ = sat_list[i - 1]
-                    self._try_add_edge(node_name, prev_node)
-                if i < len(sat_list) - 1:
-                    next_node, _ = sat_list[i + 1]
-                    self._try_add_edge(node_name, next_node)
-
-                # Collegamento con piani adiacenti: usa lo stesso sat_index_in_plane
-                sat_idx = attrs.get('sat_index_in_plane')
-                # Piano superiore (p_idx + 1)
-                if (p_idx + 1) in plane_dict:
-                    candidate = self._find_sat_by_index(plane_dict[p_idx + 1], sat_idx)
-                    if candidate is not None:
-                        self._try_add_edge(node_name, candidate[0])
-                # Piano inferiore (p_idx - 1)
-                if (p_idx - 1) in plane_dict:
-                    candidate = self._find_sat_by_index(plane_dict[p_idx - 1], sat_idx)
-                    if candidate is not None:
-                        self._try_add_edge(node_name, candidate[0])
-
-    def connect_nodes_hybrid(self, min_degree=2, extra_range_factor=1.2):
+        self.csr = None
+        n_edges = self.G.number_of_edges()
+        if candidates is None:
+            candidates = self._plus_grid_candidates()
+            instrumentation.count("candidate_pairs", len(candidates))
+            for node_a, node_b in candidates:
+                self._try_add_edge(node_a, node_b)
+        else:
+            instrumentation.count("candidate_pairs", len(candidates[0]))
+            names = list(self.G.nodes())
+            for a, b, d in zip(candidates[0].tolist(), candidates[1].tolist(), candidates[2]):
+                self._try_add_edge(names[a], names[b], d)
+        instrumentation.count("edges_added", self.G.number_of_edges() - n_edges)
+
+    def _plus_grid_candidates(self):
+        """
+        Coppie di nodi candidate della topologia +Grid, nell'ordine in cui
+        connect_nodes_plus_grid prova a collegarle (una coppia può comparire
+        due volte, una per verso).
+        """
+        return self._plane_grid().plus_grid_candidates()
+
+    def _plane_grid(self):
+        # Indice per piano e posizione dei nodi: quello del tracker se copre tutti i nodi, altrimenti dal grafo
+        if self.plane_grid is None or self.plane_grid.n_nodes != self.G.number_of_nodes():
+            self.plane_grid = PlaneGrid.from_graph(self.G)
+        return self.plane_grid
+
+    @instrumentation.timed("connect_nodes_hybrid")
+    def connect_nodes_hybrid(self, min_degree=2, extra_range_factor=1.2, candidates=None):
+        self.csr = None
         # 1. Collega secondo la topologia +Grid
-        self.connect_nodes_plus_grid()
+        self.connect_nodes_plus_grid(candidates)
 
         # 2. Collega extra basandoti sulla distanza per garantire una connettività minima
         nodes = list(self.G.nodes())
-        for node in nodes:
-            if self.G.degree(node) < min_degree:
-                # Costruisci una lista di candidati (non ancora connessi) con distanza
-                candidate_neighbors = []
-                for other in nodes:
-                    if other == node or self.G.has_edge(node, other):
-                        continue
-                    # Calcola la distanza tra 'node' e 'other'
-                    sat_node = self.G.nodes[node]
-                    sat_other = self.G.nodes[other]
-                    d = euclidean_distance(
-                        sat_node['lat'], sat_node['lon'], sat_node['alt'],
-                        sat_other['lat'], sat_other['lon'], sat_other['alt']
-                    )
-                    # Aumento il range di poco per garantire una maggiore connessione
-                    if d <= self.LISL_range * extra_range_factor:
-                        candidate_neighbors.append((other, d))
-                # Ordina i candidati per distanza
-                candidate_neighbors.sort(key=lambda x: x[1])
-                # Aggiungi collegamenti fino a raggiungere min_degree o finché ci sono candidati
-                for candidate, d in candidate_neighbors:
-                    if self.G.degree(node) >= min_degree:
-                        break
-                    # Se ha meno di 4 collegamenti li aggiungo entro un range
-                    if self.G.degree(candidate) < 4:
-                        self.G.add_edge(node, candidate, weight=d)
-
-
-    def connect_nodes(self):
+        adjacency = {node: set(self.G.adj[node]) for node in nodes}
+        repair_edges = self._min_degree_repair(nodes, self.node_positions(), adjacency, min_degree,
+                                               extra_range_factor)
+        for node, candidate, d in repair_edges:
+            self.G.add_edge(node, candidate, weight=d)
+        instrumentation.count("edges_added", len(repair_edges))
+
+    def _min_degree_repair(self, nodes, xyz, adjacency, min_degree, extra_range_factor):
+        """
+        Archi extra della topologia ibrida, nell'ordine in cui vanno aggiunti.
+        adjacency (nodo -> insieme dei vicini) viene aggiornato man mano.
+        I REPAIR_NEIGHBORS vicini più prossimi entro LISL_range * extra_range_factor
+        di tutti i nodi con meno di min_degree vicini si cercano insieme
+        (nearest_neighbors); poi, nell'ordine dei nodi, ogni nodo ancora sotto
+        min_degree si collega ai più vicini non collegati con meno di 4 archi.
+        Se i vicini trovati non bastano si passa a tutti i candidati del nodo,
+        così gli archi sono gli stessi della scansione completa.
+        """
+        max_distance = self.LISL_range * extra_range_factor
+        under = [k for k, node in enumerate(nodes) if len(adjacency[node]) < min_degree]
+        neighbors, distances, complete = nearest_neighbors(xyz, under, REPAIR_NEIGHBORS, max_distance)
+
+        repair_edges = []
+        for k, row_neighbors, row_distances, row_complete in zip(under, neighbors.tolist(), distances,
+                                                                 complete.tolist()):
+            node = nodes[k]
+            candidates = zip(row_neighbors, row_distances)
+            if not row_complete:
+                candidates = chain(candidates, self._repair_candidates(xyz, k, max_distance, len(row_neighbors)))
+            # Aggiungi collegamenti fino a raggiungere min_degree o finché ci sono candidati
+            for j, d in candidates:
+                if len(adjacency[node]) >= min_degree or j < 0:
+                    break
+                candidate = nodes[j]
+                # Se ha meno di 4 collegamenti li aggiungo entro un range
+                if candidate not in adjacency[node] and len(adjacency[candidate]) < 4:
+                    adjacency[node].add(candidate)
+                    adjacency[candidate].add(node)
+                    repair_edges.append((node, candidate, d))
+        return repair_edges
+
+    @staticmethod
+    def _repair_candidates(xyz, k, max_distance, skip):
+        # Candidati del nodo k oltre i primi skip, ordinati come in nearest_neighbors
+        # (calcolati solo se i vicini più prossimi non sono bastati)
+        distances = cartesian_distance(xyz[k], xyz)
+        order = np.lexsort((np.arange(len(xyz)), distances))
+        order = order[(order != k) & (distances[order] <= max_distance)][skip:]
+        yield from zip(order.tolist(), distances[order])
+
+    @instrumentation.timed("connect_nodes")
+    def connect_nodes(self, use_index=True, pairs=None):
+        """
+        Topologia libera: collega ogni coppia di satelliti a distanza <= LISL_range.
+        Con use_index=True le coppie candidate vengono da un indice spaziale
+        (griglia 3-D con celle di lato LISL_range) invece che dal confronto di
+        tutte le coppie; gli archi ottenuti e il loro ordine sono gli stessi.
+        pairs (i, j, distanza) sono le coppie entro LISL_range già calcolate,
+        ordinate come quelle di pairs_within_range (vedi LISLSweep).
+        """
+        self.csr = None
+        if pairs is None and not use_index:
+            self._connect_nodes_brute_force()
+            return
+
+        names = list(self.G.nodes())
+        if pairs is None:
+            pairs = pairs_within_range(self.node_positions(), self.LISL_range)
+        i, j, distance = pairs
+        instrumentation.count("edges_added", len(i))
+        if self.backend == "csr":
+            # Gli archi vanno direttamente negli array CSR, senza passare da NetworkX
+            nodes_data = [attrs for _, attrs in self.G.nodes(data=True)]
+            self.csr = CSRGraph.from_edges(names, nodes_data, i, j, distance)
+            self._edges_only_in_csr = True
+            return
+        self.G.add_edges_from((names[a], names[b], {'weight': d})
+                              for a, b, d in zip(i.tolist(), j.tolist(), distance))
+
+    @instrumentation.timed("update_topology")
+    def update_topology(self, satellites, plusGrid, min_degree=2, extra_range_factor=1.2):
+        """
+        Aggiornamento incrementale del grafo allo snapshot successivo: rimuove
+        solo i satelliti usciti, aggiunge quelli entrati, aggiorna gli attributi
+        di quelli rimasti e, per gli archi che persistono, solo il peso.
+        Nodi, archi e pesi risultanti sono gli stessi di un grafo costruito da
+        zero con add_nodes e connect_nodes_hybrid (plusGrid) o connect_nodes, e
+        così anche i percorsi: il grafo CSR e, con il backend "networkx", le
+        adiacenze di self.G seguono l'ordine della costruzione da zero, da cui
+        dipende la scelta fra percorsi con lo stesso numero di hop.
+        Restituisce il numero di archi riutilizzati, aggiunti e rimossi.
+        """
+        self.get_graph()
+        self.csr = None
+
+        names = [sat['name'] for sat in satellites]
+        index = {name: k for k, name in enumerate(names)}
+
+        # Nodi: i satelliti usciti portano via i loro archi
+        n_edges = self.G.number_of_edges()
+        self.G.remove_nodes_from([node for node in self.G if node not in index])
+        dropped = n_edges - self.G.number_of_edges()
+        for sat in satellites:
+            if sat['name'] in self.G:
+                self.G.nodes[sat['name']].update(self._node_data(sat))
+            else:
+                self.G.add_node(sat['name'], **self._node_data(sat))
+        self.plane_grid = getattr(satellites, 'plane_grid', None)
+
+        # Archi del nuovo snapshot, con chiave (indice minore, indice maggiore),
+        # nell'ordine in cui li aggiungerebbe la costruzione da zero
+        xyz = np.array([self.G.nodes[name]['xyz'] for name in names]).reshape(-1, 3)
+        if plusGrid:
+            candidates = np.array([(index[a], index[b]) for a, b in self._plus_grid_candidates()],
+                                  dtype=np.int64).reshape(-1, 2)
+            instrumentation.count("candidate_pairs", len(candidates))
+            i = candidates.min(axis=1)
+            j = candidates.max(axis=1)
+            distance = cartesian_distance(xyz[i], xyz[j])
+            keep = distance <= self.LISL_range
+            target = {}
+            for key, d in zip(zip(i[keep].tolist(), j[keep].tolist()), distance[keep]):
+                target.setdefault(key, d)
+
+            adjacency = {name: set() for name in names}
+            for a, b in target:
+                adjacency[names[a]].add(names[b])
+                adjacency[names[b]].add(names[a])
+            for a, b, d in self._min_degree_repair(names, xyz, adjacency, min_degree, extra_range_factor):
+                target[(min(index[a], index[b]), max(index[a], index[b]))] = d
+        else:
+            i, j, distance = pairs_within_range(xyz, self.LISL_range)
+            target = dict(zip(zip(i.tolist(), j.tolist()), distance))
+
+        # Archi che persistono: si aggiorna solo il peso
+        reused = 0
+        stale = []
+        for u, v, data in self.G.edges(data=True):
+            key = (index[u], index[v]) if index[u] < index[v] else (index[v], index[u])
+            weight = target.get(key)
+            if weight is None:
+                stale.append((u, v))
+            else:
+                data['weight'] = weight
+                reused += 1
+        self.G.remove_edges_from(stale)
+        added = [(names[a], names[b], {'weight': d}) for (a, b), d in target.items()
+                 if not self.G.has_edge(names[a], names[b])]
+        self.G.add_edges_from(added)
+        instrumentation.count("edges_added", len(added))
+
+        if self.backend == "csr":
+            keys = np.array(list(target), dtype=np.int64).reshape(-1, 2)
+            self.csr = CSRGraph.from_edges(names, [self.G.nodes[name] for name in names],
+                                           keys[:, 0], keys[:, 1], list(target.values()))
+        else:
+            # Le adiacenze aggiornate sul posto hanno l'ordine della storia degli
+            # aggiornamenti: si ricostruiscono nell'ordine della costruzione da zero
+            graph = nx.Graph()
+            graph.add_nodes_from((name, self.G.nodes[name]) for name in names)
+            graph.add_edges_from((names[a], names[b], {'weight': d}) for (a, b), d in target.items())
+            self.G = graph
+
+        counts = {'reused': reused, 'added': len(added), 'dropped': dropped + len(stale)}
+        print(f"Archi riutilizzati: {counts['reused']} - aggiunti: {counts['added']} - rimossi: {counts['dropped']}")
+        return counts
+
+    def _connect_nodes_brute_force(self):
         nodes = list(self.G.nodes(data=True))
+        n_edges = self.G.number_of_edges()
+        instrumentation.count("candidate_pairs", len(nodes) * (len(nodes) - 1) // 2)
         for i in range(len(nodes)):
             for j in range(i + 1, len(nodes)):
-                sat1 = nodes[i][1]
-                sat2 = nodes[j][1]
-                distance = euclidean_distance(sat1['lat'], sat1['lon'], sat1['alt'],
-                                              sat2['lat'], sat2['lon'], sat2['alt'])
+                distance = cartesian_distance(nodes[i][1]['xyz'], nodes[j][1]['xyz'])
                 if distance <= self.LISL_range:
                     self.G.add_edge(nodes[i][0], nodes[j][0], weight=distance)
+        instrumentation.count("edges_added", self.G.number_of_edges() - n_edges)
+
+    def node_positions(self):
+        # Array (n, 3) delle posizioni ECEF dei nodi, nell'ordine di self.G.nodes()
+        return np.array([attrs['xyz'] for _, attrs in self.G.nodes(data=True)]).reshape(-1, 3)
 
     def get_graph(self):
+        # Con il backend CSR il grafo NetworkX viene esportato solo quando serve
+        if self._edges_only_in_csr:
+            self.G = self.csr.to_networkx()
+            self._edges_only_in_csr = False
         return self.G
 
+    def number_of_nodes(self):
+        return self.G.number_of_nodes()
+
+    def number_of_edges(self):
+        if self._edges_only_in_csr:
+            return self.csr.number_of_edges()
+        return self.G.number_of_edges()
+
+    def get_csr(self):
+        # Grafo CSR per l'instradamento, costruito da self.G alla prima richiesta
+        # (i metodi connect_* lo invalidano quando modificano gli archi)
+        if self.csr is None:
+            self.csr = CSRGraph.from_networkx(self.G)
+        return self.csr
+
+    def _edge_weight(self, u, v):
+        if self.backend == "csr":
+            return self.get_csr().edge_weight(u, v)
+        edge = self.G.adj[u].get(v)
+        return None if edge is None else edge['weight']
+
+    def _path_weight(self, path):
+        if self.backend == "csr":
+            return self.get_csr().path_distance(path)
+        return sum(self.G[path[i]][path[i + 1]]['weight'] for i in range(len(path) - 1))
+
+    @instrumentation.timed("find_shortest_path_Dijkstra")
     def find_shortest_path_Dijkstra(self, start_node, end_node):
         try:
             # Calcola il cammino minimo basato sul peso degli archi (distanze)
-            path = nx.dijkstra_path(self.G, source=start_node, target=end_node, weight='weight')
-            total_distance = sum(self.G[path[i]][path[i + 1]]['weight'] for i in range(len(path) - 1))
+            if self.backend == "csr":
+                path = self.get_csr().dijkstra_path(start_node, end_node)
+            else:
+                path = nx.dijkstra_path(self.G, source=start_node, target=end_node, weight='weight')
+            total_distance = self._path_weight(path)
 
             print(f"Numero di Hop: {len(path) - 1} - Distanza Totale: {total_distance}")
             return path, total_distance
@@ -160,12 +349,61 @@ class SatelliteGraph:
             print("Uno o entrambi i nodi non esistono nel grafo")
 
 
+    @instrumentation.timed("find_shortest_paths_Dijkstra")
+    def find_shortest_paths_Dijkstra(self, start_node, end_nodes):
+        """
+        Cammini minimi pesati da start_node verso più destinazioni, estratti
+        da un unico albero dei cammini minimi (un solo Dijkstra dalla sorgente).
+        Restituisce un dizionario destinazione -> (percorso, distanza totale),
+        con None per le destinazioni non raggiungibili.
+        """
+        return self._tree_results(start_node, self._tree_paths(start_node, end_nodes))
+
+    @instrumentation.timed("find_shortest_paths_minHop")
+    def find_shortest_paths_minHop(self, start_node, end_nodes):
+        """
+        Cammini con il minor numero di hop da start_node verso più
+        destinazioni, da un unico albero BFS, nello stesso formato di
+        find_shortest_paths_Dijkstra. Il numero di hop è quello di
+        find_shortest_path_minHop; fra cammini con gli stessi hop può essere
+        scelto un cammino diverso da quello della BFS bidirezionale.
+        """
+        return self._tree_results(start_node, self._tree_paths(start_node, end_nodes, min_hop=True))
+
+    def _tree_paths(self, start_node, end_nodes, min_hop=False):
+        # Cammini verso end_nodes dall'albero dei cammini minimi (o BFS) di start_node, None se irraggiungibili
+        if self.backend == "csr":
+            csr = self.get_csr()
+            tree = csr.bfs_tree(start_node) if min_hop else csr.dijkstra_tree(start_node)
+            return {end_node: csr.tree_path(tree, end_node) for end_node in end_nodes}
+        if min_hop:
+            tree = nx.single_source_shortest_path(self.G, start_node)
+        else:
+            tree = nx.single_source_dijkstra_path(self.G, start_node, weight='weight')
+        return {end_node: tree.get(end_node) for end_node in end_nodes}
+
+    def _tree_results(self, start_node, paths):
+        results = {}
+        for end_node, path in paths.items():
+            if path is None:
+                print("Nessun percorso trovato tra", start_node, "e", end_node)
+                results[end_node] = None
+                continue
+            total_distance = self._path_weight(path)
+            print(f"{end_node}: Numero di Hop: {len(path) - 1} - Distanza Totale: {total_distance}")
+            results[end_node] = (path, total_distance)
+        return results
+
+    @instrumentation.timed("find_shortest_path_minHop")
     def find_shortest_path_minHop(self, start_node, end_node):
         try:
             # Calcola il cammino minimo in termini di hop
-            path = nx.shortest_path(self.G, source=start_node, target=end_node)
+            if self.backend == "csr":
+                path = self.get_csr().shortest_path(start_node, end_node)
+            else:
+                path = nx.shortest_path(self.G, source=start_node, target=end_node)
             if path is not None:
-                total_distance = sum(self.G[path[i]][path[i + 1]]['weight'] for i in range(len(path) - 1))
+                total_distance = self._path_weight(path)
                 print(f"Numero di Hop: {len(path) - 1} - Distanza Totale: {total_distance}")
             return path, total_distance
         except nx.NetworkXNoPath:
@@ -173,35 +411,99 @@ class SatelliteGraph:
         except KeyError:
             print("Uno o entrambi i nodi non esistono nel grafo")
 
+    @instrumentation.timed("city_path_matrices")
+    def city_path_matrices(self, access_nodes, cities_xyz, load_factor):
+        """
+        Matrici N x N dei percorsi fra N città con satelliti di accesso
+        access_nodes (nomi dei nodi) e posizioni ECEF cities_xyz: un albero
+        Dijkstra e un albero BFS per ogni satellite di accesso, da cui si
+        leggono i percorsi verso tutte le altre città. Restituisce un dizionario
+        con half_rtt (ms), n_hops e distance (km) per Dijkstra (suffisso _d) e
+        MinHop (_m), calcolati da calculate_total_latency come in
+        route_city_pair; le coppie non collegate hanno NaN e -1 hop, la
+        diagonale vale 0. Due città diverse con lo stesso satellite di accesso
+        sono collegate da quel solo satellite: 0 hop, distanza 0 e half_rtt
+        dato da uplink, downlink e 1 ms di elaborazione. Rispetto a
+        route_city_pair, che usa la BFS bidirezionale, i cammini MinHop hanno
+        gli stessi hop ma possono differire nella scelta fra cammini
+        equivalenti.
+        """
+        n = len(access_nodes)
+        matrices = {}
+        for suffix, min_hop in (("_d", False), ("_m", True)):
+            half_rtt = np.full((n, n), np.nan)
+            n_hops = np.full((n, n), -1, dtype=np.int32)
+            distance = np.full((n, n), np.nan)
+            trees = {}
+            for i, source in enumerate(access_nodes):
+                if source not in trees:
+                    trees[source] = self._tree_paths(source, set(access_nodes), min_hop)
+                paths = trees[source]
+                for j, target in enumerate(access_nodes):
+                    path = paths[target]
+                    if i == j:
+                        half_rtt[i, j], n_hops[i, j], distance[i, j] = 0, 0, 0
+                    elif path is not None:
+                        latency = self._path_latency(path, cities_xyz[i], cities_xyz[j], load_factor)
+                        n_hops[i, j] = len(path) - 1
+                        half_rtt[i, j] = latency * 1000 + (n_hops[i, j] + 1)
+                        distance[i, j] = self._path_weight(path)
+            matrices["half_rtt" + suffix] = half_rtt
+            matrices["n_hops" + suffix] = n_hops
+            matrices["distance" + suffix] = distance
+        return matrices
+
+    @instrumentation.timed("calculate_total_latency")
     def calculate_total_latency(self, path, city1, city2, load_factor):
-        total_latency = 0
-
-        if not path or len(path) < 2:
-            print("Il percorso deve contenere almeno due nodi.")
+        """
+        Latenza (s) fra le due città lungo path: uplink, LISL e downlink. Un
+        percorso di un solo satellite (città con lo stesso satellite di
+        accesso) ha solo uplink e downlink e 0 hop.
+        """
+        if not path:
+            print("Il percorso deve contenere almeno un nodo.")
             return None
 
-        distance_city1_sat = euclidean_distance(
-            self.G.nodes[path[0]]['lat'], self.G.nodes[path[0]]['lon'], self.G.nodes[path[0]]['alt'],
-            city1.latitude.degrees, city1.longitude.degrees, 0
-        )
-        distance_city2_sat = euclidean_distance(
-            self.G.nodes[path[-1]]['lat'], self.G.nodes[path[-1]]['lon'], self.G.nodes[path[-1]]['alt'],
-            city2.latitude.degrees, city2.longitude.degrees, 0
-        )
+        return self._path_latency(path, city1.itrs_xyz.km, city2.itrs_xyz.km, load_factor)
+
+    @instrumentation.timed("calculate_total_latencies")
+    def calculate_total_latencies(self, paths, city1, city2, load_factor):
+        """
+        Calcola in un solo passaggio latenza e numero di hop di più percorsi
+        dello stesso snapshot (es. la coppia Dijkstra e MinHop).
+        Restituisce due liste nello stesso ordine di paths; per i percorsi
+        mancanti la latenza è None e gli hop sono 0, un percorso di un solo
+        satellite ha 0 hop come in calculate_total_latency.
+        """
+        city1_xyz = city1.itrs_xyz.km
+        city2_xyz = city2.itrs_xyz.km
+        latencies = []
+        n_hops = []
+        for path in paths:
+            if not path:
+                print("Il percorso deve contenere almeno un nodo.")
+                latencies.append(None)
+                n_hops.append(0)
+                continue
+            latencies.append(self._path_latency(path, city1_xyz, city2_xyz, load_factor))
+            n_hops.append(len(path) - 1)
+        return latencies, n_hops
+
+    def _path_latency(self, path, city1_xyz, city2_xyz, load_factor):
+        total_latency = 0
+
+        distance_city1_sat = cartesian_distance(self.G.nodes[path[0]]['xyz'], city1_xyz)
+        distance_city2_sat = cartesian_distance(self.G.nodes[path[-1]]['xyz'], city2_xyz)
         lat_earth_sat = latency_calculation(distance_city1_sat) * (1 / (1 - load_factor))
         lat_sat_earth = latency_calculation(distance_city2_sat) * (1 / (1 - load_factor))
         total_latency += lat_earth_sat + lat_sat_earth
 
-        # Latenza ISL
+        # Latenza ISL: ogni arco viene letto direttamente dalla lista di adiacenza
         for i in range(len(path) - 1):
-            found = False
-            for edge in self.G.edges(data=True):
-                if (edge[0] == path[i] and edge[1] == path[i + 1]) or (edge[1] == path[i] and edge[0] == path[i + 1]):
-                    total_latency += latency_calculation(edge[2]['weight']) * (1 / (1 - load_factor))
-                    found = True
-                    break
-            if not found:
+            weight = self._edge_weight(path[i], path[i + 1])
+            if weight is None:
                 raise ValueError(f"Arco non trovato tra {path[i]} e {path[i + 1]}")
+            total_latency += latency_calculation(weight) * (1 / (1 - load_factor))
 
         return total_latency
 """
@@ -255,4 +557,53 @@ class SatelliteGraph:
         print(f"Throughput ISL Laser: {throughput_isl_laser:.3f} Gbps")
 
         return throughput_downlink_ka, throughput_uplink_ku, throughput_isl_laser
-"""
\ No newline at end of file
+"""
+
+
+class LISLSweep:
+    """
+    Archi candidati di uno snapshot calcolati una sola volta al LISL_range
+    massimo e ordinati per lunghezza: il grafo di ogni LISL_range più piccolo
+    si ottiene con una soglia sulla lista, senza ricalcolare coppie e distanze.
+    I grafi ottenuti sono identici a quelli costruiti da zero con
+    connect_nodes_hybrid (plusGrid) o connect_nodes.
+    """
+
+    def __init__(self, satellites, max_range, plusGrid):
+        self.satellites = satellites
+        self.max_range = max_range
+        self.plusGrid = plusGrid
+
+        base = SatelliteGraph(max_range)
+        base.add_nodes(satellites)
+        xyz = base.node_positions()
+        if plusGrid:
+            # Candidati +Grid (non dipendono dal range) nell'ordine in cui vengono provati
+            index = {name: k for k, name in enumerate(base.G.nodes())}
+            candidates = np.array([(index[a], index[b]) for a, b in base._plus_grid_candidates()],
+                                  dtype=np.int64).reshape(-1, 2)
+            self.i = candidates[:, 0]
+            self.j = candidates[:, 1]
+            self.distance = cartesian_distance(xyz[self.i], xyz[self.j])
+        else:
+            self.i, self.j, self.distance = pairs_within_range(xyz, max_range)
+
+        self.by_length = np.argsort(self.distance, kind='stable')
+        self.sorted_distance = self.distance[self.by_length]
+
+    def edges(self, LISL_range):
+        """Candidati con distanza <= LISL_range, nell'ordine originale della lista."""
+        if LISL_range > self.max_range:
+            raise ValueError(f"LISL_range {LISL_range} km oltre il massimo della lista ({self.max_range} km)")
+        k = np.searchsorted(self.sorted_distance, LISL_range, side='right')
+        selected = np.sort(self.by_length[:k])
+        return self.i[selected], self.j[selected], self.distance[selected]
+
+    def graph(self, LISL_range, backend="networkx", min_degree=2, extra_range_factor=1.2):
+        sat_graph = SatelliteGraph(LISL_range, backend)
+        sat_graph.add_nodes(self.satellites)
+        if self.plusGrid:
+            sat_graph.connect_nodes_hybrid(min_degree, extra_range_factor, candidates=self.edges(LISL_range))
+        else:
+            sat_graph.connect_nodes(pairs=self.edges(LISL_range))
+        return sat_graph
@@ -0,0 +1,133 @@
+import os
+
+import numpy as np
+
+import instrumentation
+from csr_graph import CSRGraph, FLOAT_FIELDS, INT_FIELDS
+from graph import SatelliteGraph
+
+# Cartella in cui vengono salvati gli archivi dei grafi degli snapshot
+GRAPH_ARCHIVE_DIR = "graph_archive"
+
+# Un record per nodo: attributi di SatelliteGraph e grado (lunghezza della riga CSR)
+NODE_DTYPE = np.dtype([('name', 'S32')] + [(field, 'f8') for field in FLOAT_FIELDS]
+                      + [(field, 'i4') for field in INT_FIELDS] + [('xyz', 'f8', (3,)), ('degree', 'i4')])
+# Un record per verso di ogni arco, nell'ordine delle righe CSR
+ADJACENCY_DTYPE = np.dtype([('index', 'i4'), ('weight', 'f8')])
+# Un record per snapshot: chiave e posizione dei suoi nodi e archi nei file
+INDEX_DTYPE = np.dtype([('start_time', 'S32'), ('lisl_range', 'f8'),
+                        ('node_offset', 'i8'), ('n_nodes', 'i8'),
+                        ('adjacency_offset', 'i8'), ('n_adjacency', 'i8')])
+
+
+class GraphArchive:
+    """
+    Archivio binario dei grafi degli snapshot di una simulazione: tre file di
+    record a lunghezza fissa (nodi, adiacenze CSR, indice) a cui ogni
+    snapshot viene aggiunto in coda e che si leggono memory-mapped. Gli
+    snapshot sono identificati dall'istante UTC (ISO) e dal LISL_range; se
+    la stessa chiave viene scritta più volte vale l'ultima.
+    Con reset=True l'archivio esistente nella cartella viene svuotato, così
+    ogni esecuzione ne scrive uno nuovo invece di accodare copie degli stessi snapshot.
+    Le adiacenze sono salvate nell'ordine del grafo CSR usato per
+    l'instradamento, così il grafo ricaricato restituisce gli stessi percorsi.
+    """
+
+    def __init__(self, folder, reset=False):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.files = {name: os.path.join(folder, name + ".bin") for name in ("nodes", "adjacency", "index")}
+        if reset:
+            for path in self.files.values():
+                if os.path.exists(path):
+                    os.remove(path)
+        self._arrays = None
+
+    @instrumentation.timed("archive_graph")
+    def append(self, start_time, LISL_range, csr):
+        """Aggiunge in coda lo snapshot (grafo CSRGraph) con chiave (start_time, LISL_range)."""
+        nodes = np.zeros(len(csr.names), dtype=NODE_DTYPE)
+        nodes['name'] = [name.encode() for name in csr.names]
+        for field in FLOAT_FIELDS + INT_FIELDS:
+            nodes[field] = csr.node_arrays[field]
+        nodes['xyz'] = csr.xyz
+        nodes['degree'] = np.diff(csr.indptr)
+
+        adjacency = np.zeros(len(csr.indices), dtype=ADJACENCY_DTYPE)
+        adjacency['index'] = csr.indices
+        adjacency['weight'] = csr.weights
+
+        entry = np.zeros(1, dtype=INDEX_DTYPE)
+        entry['start_time'] = start_time.encode()
+        entry['lisl_range'] = LISL_range
+        entry['node_offset'] = self._length("nodes", NODE_DTYPE)
+        entry['n_nodes'] = len(nodes)
+        entry['adjacency_offset'] = self._length("adjacency", ADJACENCY_DTYPE)
+        entry['n_adjacency'] = len(adjacency)
+
+        # L'indice si scrive per ultimo: uno snapshot interrotto a metà non viene mai letto
+        for name, records in (("nodes", nodes), ("adjacency", adjacency), ("index", entry)):
+            with open(self.files[name], "ab") as f:
+                f.write(records.tobytes())
+        self._arrays = None
+
+    def _length(self, name, dtype):
+        # Numero di record già presenti nel file
+        path = self.files[name]
+        return os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+
+    def _open(self):
+        # File dell'archivio memory-mapped (riaperti dopo ogni append)
+        if self._arrays is None:
+            self._arrays = {}
+            for name, dtype in (("nodes", NODE_DTYPE), ("adjacency", ADJACENCY_DTYPE), ("index", INDEX_DTYPE)):
+                length = self._length(name, dtype)
+                self._arrays[name] = (np.memmap(self.files[name], dtype=dtype, mode='r', shape=(length,))
+                                      if length else np.zeros(0, dtype=dtype))
+        return self._arrays
+
+    def keys(self):
+        """Chiavi (start_time, LISL_range) degli snapshot salvati, senza ripetizioni, in ordine di scrittura."""
+        index = self._open()["index"]
+        keys = [(start_time.decode(), LISL_range)
+                for start_time, LISL_range in zip(index['start_time'].tolist(), index['lisl_range'].tolist())]
+        return list(dict.fromkeys(keys))
+
+    def load_csr(self, start_time, LISL_range):
+        """Grafo CSRGraph dello snapshot (start_time, LISL_range)."""
+        arrays = self._open()
+        index = arrays["index"]
+        matches = np.flatnonzero((index['start_time'] == start_time.encode()) & (index['lisl_range'] == LISL_range))
+        if len(matches) == 0:
+            raise KeyError(f"Snapshot {start_time} con LISL_range {LISL_range} km non presente in {self.folder}")
+        entry = index[matches[-1]]
+
+        first = int(entry['node_offset'])
+        nodes = arrays["nodes"][first:first + int(entry['n_nodes'])]
+        first = int(entry['adjacency_offset'])
+        adjacency = arrays["adjacency"][first:first + int(entry['n_adjacency'])]
+
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(nodes['degree'], out=indptr[1:])
+        node_arrays = {field: np.array(nodes[field]) for field in FLOAT_FIELDS + INT_FIELDS}
+        return CSRGraph([name.decode() for name in nodes['name'].tolist()], node_arrays, np.array(nodes['xyz']),
+                        indptr, np.array(adjacency['index']), np.array(adjacency['weight']))
+
+    def load(self, start_time, LISL_range, backend="networkx"):
+        """
+        Ricostruisce il SatelliteGraph dello snapshot, già connesso, senza
+        propagare di nuovo le orbite. Con il backend "csr" l'instradamento
+        usa le adiacenze salvate e restituisce gli stessi percorsi della
+        simulazione originale; con "networkx" archi e pesi sono gli stessi,
+        ma i percorsi min-hop a parità di salti possono differire.
+        """
+        csr = self.load_csr(start_time, LISL_range)
+        sat_graph = SatelliteGraph(LISL_range, backend)
+        if backend == "csr":
+            for k, name in enumerate(csr.names):
+                sat_graph.G.add_node(name, **csr.node_data(k))
+            sat_graph.csr = csr
+            sat_graph._edges_only_in_csr = True
+        else:
+            sat_graph.G = csr.to_networkx()
+        return sat_graph
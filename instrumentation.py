@@ -0,0 +1,122 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+# Raccolta di tempi e contatori delle fasi della simulazione.
+# Disattivata per default: timed() e count() controllano solo ENABLED e
+# ritornano subito, span() restituisce un contesto vuoto condiviso.
+# I dati sono per processo: con più processi worker vengono raccolti solo
+# quelli delle fasi eseguite nel processo principale.
+ENABLED = False
+
+_events = []  # eventi completi (nome, inizio, durata in µs, thread, argomenti)
+_counters = defaultdict(int)
+_counter_events = []  # valori dei contatori nel tempo, per la traccia
+_origin = time.perf_counter()
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    global _origin
+    _events.clear()
+    _counters.clear()
+    _counter_events.clear()
+    _origin = time.perf_counter()
+
+
+def _now_us():
+    return (time.perf_counter() - _origin) * 1e6
+
+
+@contextlib.contextmanager
+def _span(name, args):
+    start = _now_us()
+    try:
+        yield
+    finally:
+        _events.append((name, start, _now_us() - start, threading.get_ident(), args))
+
+
+def span(name, **args):
+    """Contesto che registra la durata del blocco con il nome indicato."""
+    if not ENABLED:
+        return _NULL_SPAN
+    return _span(name, args)
+
+
+def timed(name):
+    """Decoratore: registra ogni chiamata della funzione come span name."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            with _span(name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, n=1):
+    """Incrementa il contatore name di n."""
+    if not ENABLED:
+        return
+    _counters[name] += int(n)
+    _counter_events.append((name, _now_us(), _counters[name]))
+
+
+def counters():
+    return dict(_counters)
+
+
+def summary():
+    """
+    Righe del riepilogo per span: (nome, chiamate, totale s, media ms,
+    massimo ms), in ordine di tempo totale decrescente.
+    """
+    durations = defaultdict(list)
+    for name, _, duration, _, _ in _events:
+        durations[name].append(duration / 1e3)
+    rows = [(name, len(values), sum(values) / 1e3, sum(values) / len(values), max(values))
+            for name, values in durations.items()]
+    return sorted(rows, key=lambda row: -row[2])
+
+
+def print_summary():
+    print(f"\n{'Fase':<32} {'Chiamate':>9} {'Totale (s)':>11} {'Media (ms)':>11} {'Max (ms)':>10}")
+    for name, calls, total, mean, maximum in summary():
+        print(f"{name:<32} {calls:>9} {total:>11.3f} {mean:>11.3f} {maximum:>10.3f}")
+    if _counters:
+        print(f"\n{'Contatore':<32} {'Valore':>14}")
+        for name, value in sorted(_counters.items()):
+            print(f"{name:<32} {value:>14}")
+
+
+def export_chrome_trace(filename="trace.json"):
+    """
+    Salva span e contatori nel formato Chrome Trace Event (JSON), apribile
+    con chrome://tracing o Perfetto.
+    """
+    pid = os.getpid()
+    trace = [{'name': name, 'ph': 'X', 'ts': start, 'dur': duration, 'pid': pid, 'tid': tid,
+              'args': {key: str(value) for key, value in args.items()}}
+             for name, start, duration, tid, args in _events]
+    trace += [{'name': name, 'ph': 'C', 'ts': ts, 'pid': pid, 'args': {name: value}}
+              for name, ts, value in _counter_events]
+    with open(filename, "w") as f:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+    print(f"Traccia salvata in {filename}")
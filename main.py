@@ -1,5 +1,6 @@
 from skyfield.toposlib import Topos
 
+import instrumentation
 from test import Test
 
 #city1_name = "Vancouver"
@@ -37,12 +38,43 @@ rtt_terrestrial = [
 
 #fonte sito: https://wondernetwork.com/pings
 
-t = Test()
-# Test 1: Selezionare due città e variare il LISL_range
-LISL_range = [1300, 1700, 2500, 3800, 5000]
-plusGrid = True
-load_factor = 0.15
-t.test_city_pair_with_lisl_range(city1_name, city1, "London", cities[2][1], False, LISL_range, plusGrid, load_factor)
+# Processi worker per le simulazioni (1 = seriale, es. os.cpu_count() per usare tutti i core)
+n_workers = 1
 
-# Test 2: Calcolare RTT per più città con LISL fisso
-#t.test_multiple_cities_with_fixed_lisl(city1_name, city1, cities, LISL_range[0], rtt_terrestrial, plusGrid, load_factor)
+# Test 1: archi candidati calcolati una volta al LISL_range massimo e filtrati per ogni range
+lisl_sweep = True
+
+# Esecuzione senza figure: salva i dati delle mappe in map_snapshots/, da convertire in PNG con
+# "python map_snapshot.py map_snapshots --workers N"
+headless = False
+
+# Tempi delle fasi e contatori (valutazioni SGP4, satelliti scartati, coppie candidate, archi,
+# nodi estratti da Dijkstra): riepilogo a fine esecuzione e traccia in trace.json, apribile con
+# chrome://tracing o Perfetto. Con n_workers > 1 sono raccolti solo i dati del processo principale
+instrument = False
+
+# Il guard è necessario perché i processi worker reimportano questo modulo
+if __name__ == "__main__":
+    if instrument:
+        instrumentation.enable()
+    t = Test(n_workers=n_workers, lisl_sweep=lisl_sweep, headless=headless)
+    # Test 1: Selezionare due città e variare il LISL_range
+    LISL_range = [1300, 1700, 2500, 3800, 5000]
+    plusGrid = True
+    load_factor = 0.15
+    t.test_city_pair_with_lisl_range(city1_name, city1, "London", cities[2][1], False, LISL_range, plusGrid, load_factor)
+
+    # Test 2: Calcolare RTT per più città con LISL fisso
+    # (single_source=True: un solo grafo e un solo Dijkstra per snapshot per tutte le città)
+    #t.test_multiple_cities_with_fixed_lisl(city1_name, city1, cities, LISL_range[0], rtt_terrestrial, plusGrid, load_factor, single_source=True)
+
+    # Test 3: Instradamento sul grafo espanso nel tempo (primo arrivo e latenza minima sulla finestra)
+    #t.test_temporal_routing(city1_name, city1, "London", cities[2][1], LISL_range[0], load_factor, step_seconds=30)
+
+    # Test 4: Matrice delle latenze fra tutte le coppie di città (un grafo per snapshot, Dijkstra e MinHop
+    # per tutte le coppie); un .npz per snapshot e la media nel tempo in city_matrices/
+    #t.test_city_matrix([(city1_name, city1)] + [(name, city) for name, city, _ in cities], LISL_range[0], plusGrid, load_factor)
+
+    if instrument:
+        instrumentation.print_summary()
+        instrumentation.export_chrome_trace("trace.json")
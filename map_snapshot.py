@@ -0,0 +1,128 @@
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import networkx as nx
+import numpy as np
+from skyfield.toposlib import Topos
+
+import instrumentation
+
+# Cartella predefinita dei dati delle mappe registrati in modalità headless
+SNAPSHOT_DIR = "map_snapshots"
+
+
+@instrumentation.timed("record_map_snapshot")
+def record_map_snapshot(filename, city1_name, city2_name, city1, city2, graph, start_node, end_node,
+                        path_d, path_m, range_value, E_to_W, plusGrid, start_jd=None):
+    """
+    Salva in un .npz compresso solo i dati necessari a disegnare in seguito la
+    mappa di uno snapshot: nomi e coordinate dei nodi, archi come coppie di
+    indici, percorsi, città e opzioni della mappa. Nessuna figura viene creata.
+    """
+    names = list(graph.nodes())
+    index = {name: k for k, name in enumerate(names)}
+    edges = np.array([(index[u], index[v]) for u, v in graph.edges()], dtype=np.int32).reshape(-1, 2)
+
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    np.savez_compressed(
+        filename,
+        names=np.array(names),
+        lat=np.array([data['lat'] for _, data in graph.nodes(data=True)], dtype=np.float64),
+        lon=np.array([data['lon'] for _, data in graph.nodes(data=True)], dtype=np.float64),
+        edges=edges,
+        path_d=np.array([index[node] for node in path_d or []], dtype=np.int32),
+        path_m=np.array([index[node] for node in path_m or []], dtype=np.int32),
+        start_node=np.array(start_node[0]),
+        end_node=np.array(end_node[0]),
+        city_names=np.array([city1_name, city2_name]),
+        city_coordinates=np.array([[city1.latitude.degrees, city1.longitude.degrees],
+                                   [city2.latitude.degrees, city2.longitude.degrees]]),
+        range_value=np.array(range_value),
+        E_to_W=np.array(E_to_W),
+        plusGrid=np.array(plusGrid),
+        start_jd=np.array(start_jd if start_jd is not None else (np.nan, np.nan)),
+    )
+
+
+def load_map_snapshot(filename):
+    """
+    Rilegge uno snapshot salvato da record_map_snapshot e ricostruisce gli
+    argomenti di SatelliteVisualization (grafo con lat/lon dei nodi, città come Topos).
+    """
+    with np.load(filename) as data:
+        names = data['names'].tolist()
+        graph = nx.Graph()
+        for name, lat, lon in zip(names, data['lat'].tolist(), data['lon'].tolist()):
+            graph.add_node(name, lat=lat, lon=lon)
+        graph.add_edges_from((names[a], names[b]) for a, b in data['edges'].tolist())
+
+        (lat1, lon1), (lat2, lon2) = data['city_coordinates'].tolist()
+        return {
+            'city1_name': str(data['city_names'][0]),
+            'city2_name': str(data['city_names'][1]),
+            'city1': Topos(latitude_degrees=lat1, longitude_degrees=lon1),
+            'city2': Topos(latitude_degrees=lat2, longitude_degrees=lon2),
+            'graph': graph,
+            'start_node': (str(data['start_node']),),
+            'end_node': (str(data['end_node']),),
+            'path_d': [names[k] for k in data['path_d'].tolist()] or None,
+            'path_m': [names[k] for k in data['path_m'].tolist()] or None,
+            'range_value': data['range_value'].item(),
+            'E_to_W': bool(data['E_to_W']),
+            'plusGrid': bool(data['plusGrid']),
+        }
+
+
+def render_map_snapshot(filename, out_folder=None, dpi=600):
+    """Disegna la mappa di uno snapshot registrato e la salva come PNG; restituisce il percorso del PNG."""
+    # Import qui: il backend non interattivo va scelto prima di creare figure
+    import matplotlib.pyplot as plt
+    from visualization import SatelliteVisualization
+    plt.switch_backend("Agg")
+
+    snapshot = load_map_snapshot(filename)
+    png_file = os.path.join(out_folder or os.path.dirname(filename),
+                            os.path.splitext(os.path.basename(filename))[0] + ".png")
+
+    viz = SatelliteVisualization(snapshot['city1_name'], snapshot['city2_name'], snapshot['city1'],
+                                 snapshot['city2'], snapshot['graph'], [], snapshot['start_node'],
+                                 snapshot['end_node'], snapshot['E_to_W'], False, snapshot['plusGrid'])
+    viz.draw_map()
+    viz.add_cities()
+    viz.plot_edges(snapshot['path_d'], snapshot['path_m'], snapshot['range_value'])
+    viz.plot_nodes(snapshot['path_d'])
+    viz.show(save_as_png=True, filename=png_file, dpi=dpi)
+    plt.close('all')
+    return png_file
+
+
+def render_map_snapshots(filenames, out_folder=None, n_workers=1, dpi=600):
+    """
+    Converte in PNG gli snapshot indicati, in serie o su un pool di processi.
+    Restituisce i percorsi dei PNG nell'ordine di filenames.
+    """
+    if out_folder is not None:
+        os.makedirs(out_folder, exist_ok=True)
+    if n_workers <= 1:
+        return [render_map_snapshot(filename, out_folder, dpi) for filename in filenames]
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        return list(executor.map(render_map_snapshot, filenames,
+                                 [out_folder] * len(filenames), [dpi] * len(filenames)))
+
+
+if __name__ == "__main__":
+    # Uso: python map_snapshot.py [cartella o file .npz ...] [--workers N] [--dpi D]
+    args = sys.argv[1:]
+    options = {'--workers': 1, '--dpi': 600}
+    for option in options:
+        if option in args:
+            position = args.index(option)
+            options[option] = int(args[position + 1])
+            del args[position:position + 2]
+
+    filenames = []
+    for arg in args or [SNAPSHOT_DIR]:
+        filenames += sorted(glob.glob(os.path.join(arg, "*.npz"))) if os.path.isdir(arg) else [arg]
+    render_map_snapshots(filenames, n_workers=options['--workers'], dpi=options['--dpi'])
@@ -14,9 +14,9 @@ class PlotGenerator:
         plt.figure(figsize=(10, 6))
 
         # Solo colonne per RTT/2
-        plt.bar(x - width / 2, dh.avg_half_rtt_d_list, width,
+        plt.bar(x - width / 2, dh.get_averages("half_rtt", "Dijkstra", LISL_range), width,
                 label='RTT/2 Dijkstra', color='blue')
-        plt.bar(x + width / 2, dh.avg_half_rtt_m_list, width,
+        plt.bar(x + width / 2, dh.get_averages("half_rtt", "MinHop", LISL_range), width,
                 label='RTT/2 MinHop', color='orange')
 
         plt.xlabel("Range LISL (km)")
@@ -38,9 +38,9 @@ class PlotGenerator:
         plt.figure(figsize=(10, 6))
 
         # Grafico per Dijkstra
-        plt.plot(LISL_range, dh.avg_distance_d_list, marker='o', label="Dijkstra")
+        plt.plot(LISL_range, dh.get_averages("distance", "Dijkstra", LISL_range), marker='o', label="Dijkstra")
         # Grafico per MinHop
-        plt.plot(LISL_range, dh.avg_distance_m_list, marker='s', label="MinHop")
+        plt.plot(LISL_range, dh.get_averages("distance", "MinHop", LISL_range), marker='s', label="MinHop")
 
         plt.xlabel("Range LISL (km)")
         plt.ylabel("Distanza Totale (km)")
@@ -57,9 +57,9 @@ class PlotGenerator:
         plt.figure(figsize=(10, 6))
 
         # Grafico per Dijkstra
-        plt.plot(LISL_range, dh.avg_n_hops_d_list, marker='o', label="Dijkstra")
+        plt.plot(LISL_range, dh.get_averages("n_hops", "Dijkstra", LISL_range), marker='o', label="Dijkstra")
         # Grafico per MinHop
-        plt.plot(LISL_range, dh.avg_n_hops_m_list, marker='s', label="MinHop")
+        plt.plot(LISL_range, dh.get_averages("n_hops", "MinHop", LISL_range), marker='s', label="MinHop")
 
         plt.xlabel("Range LISL (km)")
         plt.ylabel("Numero di salti")
@@ -118,20 +118,9 @@ class PlotGenerator:
         plt.show()
 
     def plot_violin_distance_distribution(self, dh):
-        dijkstra_data = {}
-        minhop_data = {}
-
-        for d in dh.dict_results_d:
-            r = d["Range"]
-            if r not in dijkstra_data:
-                dijkstra_data[r] = []
-            dijkstra_data[r].append(d["Distance"])
-
-        for m in dh.dict_results_m:
-            r = m["Range"]
-            if r not in minhop_data:
-                minhop_data[r] = []
-            minhop_data[r].append(m["Distance"])
+        # Distanze di ogni snapshot per range, lette dal database dei risultati
+        dijkstra_data = dh.get_values("distance", "Dijkstra")
+        minhop_data = dh.get_values("distance", "MinHop")
 
         # Ordina i range per coerenza visiva
         sorted_ranges = sorted(set(dijkstra_data.keys()) | set(minhop_data.keys()))
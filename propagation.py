@@ -0,0 +1,170 @@
+from datetime import timedelta
+
+import numpy as np
+from sgp4.api import SatrecArray
+from skyfield.constants import DAY_S
+from skyfield.framelib import itrs
+from skyfield.functions import mxm, _T
+from skyfield.sgp4lib import TEME
+
+import instrumentation
+
+# Geoide IERS2010, lo stesso usato da Geocentric.subpoint() di Skyfield
+IERS2010_RADIUS_KM = 6378.1366
+IERS2010_INV_FLATTENING = 298.25642
+IERS2010_E2 = (2.0 - 1.0 / IERS2010_INV_FLATTENING) / IERS2010_INV_FLATTENING
+IERS2010_POLAR_RADIUS_KM = IERS2010_RADIUS_KM * (1.0 - 1.0 / IERS2010_INV_FLATTENING)
+
+# Maggiorazione (km) del raggio per i termini periodici di SGP4 non modellati da
+# orbit_bounds: corto periodo J2 e lungo periodo J3, ciascuno di pochi km in LEO
+PERIODIC_MARGIN_KM = 25.0
+
+# Numero massimo di campioni (satelliti x istanti) propagati insieme,
+# per limitare la memoria occupata dagli array intermedi
+CHUNK_SAMPLES = 300000
+
+
+def window_times(ts, start_time, end_time, step=timedelta(seconds=1)):
+    """
+    Restituisce un array Time con gli istanti start_time, start_time + step, ...
+    fino a end_time compreso, sommando lo step come fa il ciclo scalare
+    (così gli istanti coincidono esattamente con quelli del ciclo).
+    """
+    whole = []
+    fraction = []
+    current_time = start_time
+    end = end_time.utc_datetime()
+    while current_time.utc_datetime() <= end:
+        whole.append(current_time.whole)
+        fraction.append(current_time.tt_fraction)
+        current_time += step
+    return ts.tt_jd(np.array(whole), np.array(fraction))
+
+
+def teme_to_itrs_matrix(t):
+    """
+    Matrice di rotazione (3, 3, N) da TEME a ITRS per ogni istante di t,
+    composta come in EarthSatellite.at(t).frame_xyz(itrs).
+    """
+    return mxm(itrs.rotation_at(t), _T(TEME.rotation_at(t)))
+
+
+def propagate_itrs(satellites, t, out=None):
+    """
+    Propaga tutti i satelliti su tutti gli istanti di t con un'unica chiamata
+    SGP4 vettoriale (SatrecArray) per blocco di satelliti.
+    Restituisce le posizioni ITRS in km con forma (n_sat, n_tempi, 3);
+    i satelliti con errore SGP4 hanno posizione NaN.
+    Se out è indicato (anche un memmap float32) i risultati vengono scritti lì.
+    """
+    jd = t.whole
+    fraction = t.tai_fraction - t._leap_seconds() / DAY_S
+    R = teme_to_itrs_matrix(t)
+
+    if out is None:
+        out = np.empty((len(satellites), len(jd), 3))
+    instrumentation.count("sgp4_evaluations", len(satellites) * len(jd))
+    chunk_size = max(1, CHUNK_SAMPLES // len(jd))
+    for first in range(0, len(satellites), chunk_size):
+        chunk = satellites[first:first + chunk_size]
+        sat_array = SatrecArray([sat.model for sat in chunk])
+        error, r, _ = sat_array.sgp4(jd, fraction)
+        r[error != 0] = np.nan
+        # r ha forma (n_sat, n_tempi, 3), R ha forma (3, 3, n_tempi)
+        out[first:first + len(chunk)] = np.einsum('ijt,stj->sti', R, r)
+    return out
+
+
+def orbit_bounds(satellites, start_time, end_time):
+    """
+    Limiti analitici delle orbite tra start_time ed end_time ricavati dagli
+    elementi dei TLE, senza chiamate SGP4: raggio minimo e massimo (km) e
+    latitudine massima raggiungibile (gradi, pari all'inclinazione o al suo
+    supplementare per le orbite retrograde). Array di lunghezza len(satellites).
+
+    Semiasse maggiore ed eccentricità medi seguono la parte secolare di SGP4
+    (coefficienti di resistenza atmosferica cc1, cc4, cc5, d2-d4 calcolati
+    come in sgp4init) agli estremi della finestra; il termine periodico di
+    cc5 è maggiorato con il suo valore massimo e i termini periodici di
+    posizione (corto periodo J2, lungo periodo J3) con PERIODIC_MARGIN_KM.
+    Per i satelliti deep-space il raggio non è limitato.
+    """
+    models = [sat.model for sat in satellites]
+    if not models:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+
+    def element(name):
+        return np.array([getattr(model, name) for model in models], dtype=np.float64)
+
+    ao, no, ecco, inclo, argpo, bstar = (element(name) for name in ("a", "no", "ecco", "inclo", "argpo", "bstar"))
+    epoch = element("jdsatepoch") + element("jdsatepochF")
+    radius, j2 = models[0].radiusearthkm, models[0].j2
+    deep_space = np.array([model.method == 'd' for model in models], dtype=bool)
+
+    # sgp4init: coefficienti della resistenza atmosferica (raggi terrestri e minuti)
+    cosio, sinio = np.cos(inclo), np.sin(inclo)
+    con41 = 3.0 * cosio ** 2 - 1.0
+    x1mth2 = 1.0 - cosio ** 2
+    omeosq = 1.0 - ecco ** 2
+    perige = (ao * (1.0 - ecco) - 1.0) * radius
+    isimp = ao * (1.0 - ecco) < 220.0 / radius + 1.0
+    sfour = np.where(perige < 156.0, np.where(perige < 98.0, 20.0, perige - 78.0), 78.0)
+    qzms24 = ((120.0 - sfour) / radius) ** 4
+    sfour = sfour / radius + 1.0
+    tsi = 1.0 / (ao - sfour)
+    eta = ao * ecco * tsi
+    etasq = eta ** 2
+    eeta = ecco * eta
+    psisq = np.abs(1.0 - etasq)
+    coef = qzms24 * tsi ** 4
+    coef1 = coef / psisq ** 3.5
+    cc1 = bstar * coef1 * no * (ao * (1.0 + 1.5 * etasq + eeta * (4.0 + etasq))
+                                + 0.375 * j2 * tsi / psisq * con41 * (8.0 + 3.0 * etasq * (8.0 + etasq)))
+    cc4 = 2.0 * no * coef1 * ao * omeosq * (
+        eta * (2.0 + 0.5 * etasq) + ecco * (0.5 + 2.0 * etasq)
+        - j2 * tsi / (ao * psisq) * (-3.0 * con41 * (1.0 - 2.0 * eeta + etasq * (1.5 - 0.5 * eeta))
+                                     + 0.75 * x1mth2 * (2.0 * etasq - eeta * (1.0 + etasq)) * np.cos(2.0 * argpo)))
+    cc5 = 2.0 * coef1 * ao * omeosq * (1.0 + 2.75 * (etasq + eeta) + eeta * etasq)
+    d2 = np.where(isimp, 0.0, 4.0 * ao * tsi * cc1 ** 2)
+    temp = d2 * tsi * cc1 / 3.0
+    d3 = (17.0 * ao + sfour) * temp
+    d4 = 0.5 * temp * ao * tsi * (221.0 * ao + 31.0 * sfour) * cc1
+
+    # sgp4: semiasse e eccentricità medi agli estremi della finestra (minuti dall'epoca del TLE)
+    a_bounds, e_bounds = [], []
+    for t in (start_time, end_time):
+        tsince = (t.whole + t.tai_fraction - t._leap_seconds() / DAY_S - epoch) * 1440.0
+        tempa = 1.0 - cc1 * tsince - d2 * tsince ** 2 - d3 * tsince ** 3 - d4 * tsince ** 4
+        a_bounds.append(ao * tempa ** 2)
+        e_bounds.append(ecco - bstar * cc4 * tsince)
+    e_max = np.maximum(*e_bounds) + np.where(isimp, 0.0, 2.0 * np.abs(bstar * cc5))
+    e_max = np.clip(e_max, 1e-6, 1.0)
+
+    r_min = np.minimum(*a_bounds) * (1.0 - e_max) * radius - PERIODIC_MARGIN_KM
+    r_max = np.maximum(*a_bounds) * (1.0 + e_max) * radius + PERIODIC_MARGIN_KM
+    r_min = np.where(deep_space, 0.0, r_min)
+    r_max = np.where(deep_space, np.inf, r_max)
+    inclination = np.degrees(inclo)
+    return r_min, r_max, np.minimum(inclination, 180.0 - inclination)
+
+
+def itrs_to_geodetic(xyz):
+    """
+    Converte posizioni ITRS (..., 3) in km nelle coordinate geodetiche
+    (lat, lon in gradi, alt in km) sul geoide IERS2010, con la stessa
+    iterazione usata da Skyfield.
+    """
+    x = xyz[..., 0]
+    y = xyz[..., 1]
+    z = xyz[..., 2]
+    R = np.sqrt(x * x + y * y)
+    lat = np.arctan2(z, R)
+    for _ in range(3):
+        sin_lat = np.sin(lat)
+        e2_sin_lat = IERS2010_E2 * sin_lat
+        aC = IERS2010_RADIUS_KM / np.sqrt(1.0 - e2_sin_lat * sin_lat)
+        hyp = z + aC * e2_sin_lat
+        lat = np.arctan2(hyp, R)
+    lon = (np.arctan2(y, x) - np.pi) % (2 * np.pi) - np.pi
+    alt = np.sqrt(hyp * hyp + R * R) - aC
+    return np.degrees(lat), np.degrees(lon), alt
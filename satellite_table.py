@@ -0,0 +1,169 @@
+import numpy as np
+
+from propagation import itrs_to_geodetic
+
+# Piani orbitali per giro di RAAN con la soglia di 10° di assign_plane_and_position
+N_PLANES = 36
+
+
+class SatelliteTable:
+    """
+    Satelliti validati di uno snapshot in array contigui, uno per campo:
+    nomi, RAAN in gradi ('plane'), posizione ECEF a metà finestra ('xyz') e
+    le sue coordinate geodetiche ('lat', 'lon', 'alt'), track (n, campioni, 3)
+    con (lat, lon, alt) per ogni secondo e, dopo assign_plane_and_position,
+    plane_index e sat_index_in_plane. Con E_to_W le longitudini negative,
+    come nel track, sono riportate in [180, 360).
+    Si usa come la lista di dict di prima: len, iterazione e indice intero
+    restituiscono SatelliteRecord, che si legge come un dict (sat['track'],
+    sat.get('plane_index'), dict(sat)).
+    """
+
+    FIELDS = ('name', 'track', 'plane', 'xyz', 'lat', 'lon', 'alt', 'plane_index', 'sat_index_in_plane')
+
+    def __init__(self, names, track, plane, xyz, E_to_W=False):
+        self.names = list(names)
+        n = len(self.names)
+        self.track = np.ascontiguousarray(track, dtype=np.float64)  # (n, campioni, 3)
+        self.plane = np.asarray(plane, dtype=np.float64).reshape(n)
+        self.xyz = np.ascontiguousarray(xyz, dtype=np.float64).reshape(n, 3)
+        # Posizione a metà finestra in coordinate geodetiche: è quella di xyz, usata per
+        # mappe e ordinamento nei piani (nessuna media di longitudini attraverso ±180°)
+        self.E_to_W = E_to_W
+        self.lat, self.lon, self.alt = itrs_to_geodetic(self.xyz)
+        if E_to_W:
+            self.lon = np.where(self.lon < 0, self.lon + 360, self.lon)
+        # Assegnati da assign_plane_and_position (None finché non calcolati)
+        self.plane_index = None
+        self.sat_index_in_plane = None
+        # Indice (plane_index, sat_index_in_plane) -> satellite (PlaneGrid)
+        self.plane_grid = None
+
+    @classmethod
+    def empty(cls, n_samples=0):
+        return cls([], np.zeros((0, n_samples, 3)), np.zeros(0), np.zeros((0, 3)))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return (SatelliteRecord(self, i) for i in range(len(self.names)))
+
+    def __getitem__(self, i):
+        if not -len(self.names) <= i < len(self.names):
+            raise IndexError(i)
+        return SatelliteRecord(self, i % len(self.names))
+
+    def value(self, field, i):
+        # Valore di field per il satellite i, con i tipi dei vecchi record dict
+        if field == 'name':
+            return self.names[i]
+        column = getattr(self, field)
+        if column is None:
+            return None
+        if field in ('plane_index', 'sat_index_in_plane'):
+            return int(column[i])
+        return column[i]
+
+    def copy(self):
+        table = SatelliteTable(self.names, self.track.copy(), self.plane.copy(), self.xyz.copy(), self.E_to_W)
+        for field in ('plane_index', 'sat_index_in_plane'):
+            column = getattr(self, field)
+            setattr(table, field, None if column is None else column.copy())
+        table.plane_grid = self.plane_grid
+        return table
+
+    def nbytes(self):
+        """Memoria occupata dagli array numerici della tabella, in byte."""
+        return sum(column.nbytes for column in (self.track, self.plane, self.xyz, self.lat, self.lon, self.alt,
+                                                self.plane_index, self.sat_index_in_plane) if column is not None)
+
+
+class SatelliteRecord:
+    """Vista in sola lettura di una riga di SatelliteTable, con l'interfaccia di un dict."""
+
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, field):
+        if field not in SatelliteTable.FIELDS:
+            raise KeyError(field)
+        value = self.table.value(field, self.index)
+        if value is None:
+            raise KeyError(field)
+        return value
+
+    def get(self, field, default=None):
+        if field not in SatelliteTable.FIELDS:
+            return default
+        value = self.table.value(field, self.index)
+        return default if value is None else value
+
+    def __contains__(self, field):
+        return self.get(field) is not None
+
+    def keys(self):
+        return [field for field in SatelliteTable.FIELDS if field in self]
+
+    def __repr__(self):
+        return f"SatelliteRecord({self.table.names[self.index]!r})"
+
+
+class PlaneGrid:
+    """
+    Indice dei satelliti di uno snapshot per piano orbitale e posizione nel
+    piano: (plane_index, sat_index_in_plane) -> nome del nodo in O(1).
+    Viene costruito una volta da assign_plane_and_position e riusato da
+    SatelliteGraph per la topologia +Grid. I piani sono n_planes su un giro
+    di RAAN: il piano successivo all'ultimo è il piano 0, così la griglia si
+    chiude fra i piani n_planes - 1 e 0.
+    """
+
+    def __init__(self, names, plane_index, sat_index_in_plane, n_planes=N_PLANES):
+        self.n_planes = n_planes
+        self.slots = {}
+        members = {}
+        for name, plane, slot in zip(names, plane_index, sat_index_in_plane):
+            if plane is None:
+                continue
+            # A parità di posizione vale il primo satellite, come nella ricerca lineare
+            self.slots.setdefault((plane, slot), name)
+            members.setdefault(plane, []).append((slot, name))
+        # Satelliti di ogni piano in ordine di sat_index_in_plane (ordinamento stabile)
+        self.planes = {plane: sorted(plane_members, key=lambda member: member[0])
+                       for plane, plane_members in members.items()}
+        self.n_nodes = sum(len(plane_members) for plane_members in self.planes.values())
+
+    @classmethod
+    def from_graph(cls, G, n_planes=N_PLANES):
+        nodes = list(G.nodes(data=True))
+        return cls([name for name, _ in nodes], [attrs.get('plane_index') for _, attrs in nodes],
+                   [attrs.get('sat_index_in_plane') for _, attrs in nodes], n_planes)
+
+    def node(self, plane, slot):
+        """Nodo nella posizione slot del piano plane (modulo n_planes), o None."""
+        return self.slots.get((plane % self.n_planes, slot))
+
+    def plus_grid_candidates(self):
+        """
+        Coppie candidate della topologia +Grid: per ogni satellite, in ordine
+        di piano e di posizione, il precedente e il successivo nello stesso
+        piano e quello con la stessa posizione nel piano superiore e in
+        quello inferiore (una coppia può comparire due volte, una per verso).
+        """
+        candidates = []
+        for plane in sorted(self.planes):
+            plane_members = self.planes[plane]
+            for i, (slot, name) in enumerate(plane_members):
+                if i > 0:
+                    candidates.append((name, plane_members[i - 1][1]))
+                if i < len(plane_members) - 1:
+                    candidates.append((name, plane_members[i + 1][1]))
+                for neighbour in (plane + 1, plane - 1):
+                    other = self.node(neighbour, slot)
+                    if other is not None and other != name:
+                        candidates.append((name, other))
+        return candidates
@@ -1,17 +1,40 @@
-from skyfield.api import load
 from datetime import timedelta
 import numpy as np  # Se lo sposti in utils.py, ricordati di importarlo anche qui se necessario
 
-from utils import euclidean_distance
-from collections import defaultdict
+from skyfield.framelib import itrs
+
+import catalog
+import instrumentation
+from propagation import (window_times, propagate_itrs, itrs_to_geodetic, orbit_bounds, IERS2010_RADIUS_KM,
+                         IERS2010_POLAR_RADIUS_KM)
+from satellite_table import PlaneGrid, SatelliteTable
+from utils import ground_access
+
+# Fascia di altitudine (km) dei satelliti validati
+MIN_ALTITUDE_KM = 500
+MAX_ALTITUDE_KM = 570
+# Maggiorazione (gradi) della latitudine massima nel prefiltro orbitale: copre la
+# differenza fra latitudine geodetica e geocentrica (< 0.2°) e le oscillazioni dell'inclinazione
+PREFILTER_LATITUDE_MARGIN_DEG = 0.5
+# Passi (secondi) della ricerca adattiva, dal più grossolano: a ogni livello i satelliti
+# vengono controllati solo negli istanti multipli del passo, prima del campionamento a 1 s
+ADAPTIVE_STEPS = (300, 30)
+# Durata della finestra in cui un satellite deve restare nelle regioni per essere validato
+FILTER_WINDOW = timedelta(minutes=5)
+
 
 class SatelliteTracker:
 
-    def __init__(self, city1, city2, start_time, E_to_W, tle_file="gp.txt"):
+    def __init__(self, city1, city2, start_time, E_to_W, tle_file="gp.txt", ephemeris=None):
         # Carica i TLE (se è da aggiornare usare l'URL - ricordarsi di cambiare la data di test)
         tle_url = "https://celestrak.org/NORAD/elements/gp.php?GROUP=starlink&FORMAT=tle"
-        self.ts = load.timescale()
-        self.satellites = load.tle_file(tle_file)
+        # Il catalogo viene letto una sola volta per processo e condiviso fra i tracker
+        self.ts = catalog.get_timescale()
+        self.satellites = catalog.load_satellites(tle_file)
+        # Effemeridi precalcolate (EphemerisStore): se presenti sostituiscono SGP4
+        self.ephemeris = ephemeris
+        if ephemeris is not None:
+            self.satellites = ephemeris.satellites
         # self.satellites = load.tle_file(tle_url)
         print(f"\nSatelliti caricati: {len(self.satellites)}")
 
@@ -35,89 +58,263 @@ class SatelliteTracker:
         self.min_lon = min(self.city1_lon, self.city2_lon) - offset
         self.max_lon = max(self.city1_lon, self.city2_lon) + offset
 
+        # Regioni (min_lat, max_lat, min_lon, max_lon, E_to_W) in cui cercare i satelliti:
+        # la coppia di città del costruttore più quelle aggiunte con add_region()
+        self.regions = [(self.min_lat, self.max_lat, self.min_lon, self.max_lon, E_to_W)]
+
         # Intervallo di tempo per la traccia
         self.start_time = start_time
-        self.end_time = self.start_time + timedelta(minutes=5)
+        self.end_time = self.start_time + FILTER_WINDOW
+
+        self.satellite_validated = SatelliteTable.empty()
+        # Satelliti esclusi dall'ultimo prefiltro orbitale
+        self.prefilter_skipped = 0
 
-        self.satellite_validated = []
+    def add_region(self, city1, city2, E_to_W, offset=20):
+        """
+        Aggiunge la regione di un'altra coppia di città: un satellite viene
+        validato se resta per tutta la finestra dentro almeno una regione,
+        quindi i satelliti validati comprendono quelli di ogni coppia.
+        Le regioni contenute in un'altra non cambiano l'unione e non vengono
+        tenute, così anche con molte coppie di città le regioni restano poche.
+        """
+        lats = [city1.latitude.degrees, city2.latitude.degrees]
+        lons = [city1.longitude.degrees, city2.longitude.degrees]
+        if E_to_W:
+            lons = [lon + 360 if lon < 0 else lon for lon in lons]
+        region = (min(lats) - offset, max(lats) + offset + 10, min(lons) - offset, max(lons) + offset, E_to_W)
+        if any(self._contains(other, region) for other in self.regions):
+            return
+        self.regions = [other for other in self.regions if not self._contains(region, other)] + [region]
 
-    def filter_satellites(self):
+    @staticmethod
+    def _contains(outer, inner):
+        # True se la regione inner è tutta dentro outer (stessa convenzione delle longitudini)
+        return outer[4] == inner[4] and outer[0] <= inner[0] and inner[1] <= outer[1] and \
+            outer[2] <= inner[2] and inner[3] <= outer[3]
+
+    @instrumentation.timed("filter_satellites")
+    def filter_satellites(self, vectorized=True, prefilter=True, adaptive=True):
         """
         Filtra i satelliti che rientrano nel range specificato e, per ciascuno,
         calcola la traccia (track) per un minuto (campionando ogni secondo).
+        Con vectorized=True tutti i satelliti vengono propagati sull'intera
+        finestra con un'unica operazione su array (o letti dalle effemeridi
+        precalcolate, se il tracker ne ha); con vectorized=False si usa
+        il ciclo scalare originale (un sat.at() per satellite e per secondo).
+        Con prefilter=True i satelliti che non possono rientrare nella fascia
+        di altitudine o nelle latitudini delle regioni vengono esclusi prima
+        della propagazione (vedi prefilter_satellites). Con adaptive=True
+        (solo vettoriale, senza effemeridi) la finestra a 1 s si propaga solo
+        per i satelliti che superano i controlli a passo grossolano
+        (vedi coarse_candidates).
+        I satelliti validati sono restituiti come SatelliteTable.
         """
-        for sat in self.satellites:
+        candidates = self.prefilter_satellites() if prefilter else np.arange(len(self.satellites))
+        self.prefilter_skipped = len(self.satellites) - len(candidates)
+        instrumentation.count("rejected_prefilter", self.prefilter_skipped)
+        if prefilter:
+            print(f"Satelliti esclusi dal prefiltro orbitale: {self.prefilter_skipped}")
+
+        if vectorized:
+            self._filter_satellites_vectorized(candidates, adaptive)
+        else:
+            self._filter_satellites_scalar(candidates)
+
+        # Assegna plane_index e sat_index_in_plane ai satelliti validati
+        self.assign_plane_and_position(angle_threshold=10)
+        return self.satellite_validated
+
+    def prefilter_satellites(self):
+        """
+        Indici dei satelliti che possono superare il controllo completo,
+        decisi dagli elementi orbitali dei TLE senza propagare (orbit_bounds).
+        Il filtro è conservativo: un satellite viene escluso solo se il suo
+        raggio orbitale lo tiene per tutta la finestra sopra o sotto la
+        fascia di altitudine (con il geoide fra raggio polare ed equatoriale),
+        oppure se la sua latitudine massima non raggiunge nessuna regione.
+        """
+        if not self.satellites:
+            return np.zeros(0, dtype=np.int64)
+        r_min, r_max, max_latitude = orbit_bounds(self.satellites, self.start_time, self.end_time)
+        altitude_ok = (r_min - IERS2010_RADIUS_KM <= MAX_ALTITUDE_KM) & \
+                      (r_max - IERS2010_POLAR_RADIUS_KM >= MIN_ALTITUDE_KM)
+
+        reach = max_latitude + PREFILTER_LATITUDE_MARGIN_DEG
+        latitude_ok = np.zeros(len(self.satellites), dtype=bool)
+        for min_lat, max_lat, _, _, _ in self.regions:
+            latitude_ok |= (min_lat <= reach) & (max_lat >= -reach)
+        return np.flatnonzero(altitude_ok & latitude_ok)
+
+    def _filter_satellites_scalar(self, candidates):
+        validated, tracks, positions = [], [], []
+        for sat in (self.satellites[i] for i in candidates):
             track = []
+            track_xyz = []
             current_time = self.start_time
+            # Regioni in cui il satellite è rimasto finora
+            regions = self.regions
             is_within_range = True
 
             while current_time.utc_datetime() <= self.end_time.utc_datetime() and is_within_range:
-                subpoint = sat.at(current_time).subpoint()
+                position = sat.at(current_time)
+                instrumentation.count("sgp4_evaluations")
+                subpoint = position.subpoint()
                 sat_lat = subpoint.latitude.degrees
                 sat_lon = subpoint.longitude.degrees
                 sat_alt = subpoint.elevation.km
 
-                if self.E_to_W:
-                    if sat_lon < 0:
-                        sat_lon += 360
-
                 # Controllo lat, lon, alt
-                if not ((self.min_lat <= sat_lat <= self.max_lat) and
-                        (self.min_lon <= sat_lon <= self.max_lon)) or not (500 <= sat_alt <= 570):
+                regions = [region for region in regions
+                           if self._in_region(region, sat_lat, sat_lon) and self._in_altitude_band(sat_alt)]
+                if not regions:
                     is_within_range = False
+                    if self._in_altitude_band(sat_alt):
+                        instrumentation.count("rejected_bounding_box")
+                    else:
+                        instrumentation.count("rejected_altitude")
 
                 if is_within_range:
+                    if self.E_to_W:
+                        if sat_lon < 0:
+                            sat_lon += 360
                     track.append((sat_lat, sat_lon, sat_alt))
+                    track_xyz.append(position.frame_xyz(itrs).km)
 
                 current_time += timedelta(seconds=1)
 
             if is_within_range and len(track) > 2:
-                # RAAN in gradi (memorizzato in 'plane')
-                orbital_plane = np.degrees(sat.model.nodeo) % 360
-                self.satellite_validated.append({
-                    'name': sat.name,
-                    'track': track,
-                    'plane': orbital_plane
-                })
+                validated.append(sat)
+                tracks.append(track)
+                positions.append(track_xyz[len(track_xyz) // 2])
 
-        # Assegna plane_index e sat_index_in_plane ai satelliti validati
-        self.assign_plane_and_position(angle_threshold=10)
-        return self.satellite_validated
+        n_samples = len(tracks[0]) if tracks else 0
+        self._set_validated(validated, np.array(tracks).reshape(len(tracks), n_samples, 3), positions)
 
-    def assign_plane_and_position(self, angle_threshold=10):
+    def _filter_satellites_vectorized(self, candidates, adaptive):
+        satellites = [self.satellites[i] for i in candidates]
+        if self.ephemeris is not None:
+            xyz = self.ephemeris.window(self.start_time, self.end_time,
+                                        None if len(satellites) == len(self.satellites) else candidates)
+        else:
+            times = window_times(self.ts, self.start_time, self.end_time)
+            if adaptive:
+                satellites = [satellites[i] for i in self.coarse_candidates(satellites, times)]
+            xyz = propagate_itrs(satellites, times)
+        sat_lat, sat_lon, sat_alt = itrs_to_geodetic(xyz)
+        valid = self._within_regions(sat_lat, sat_lon, sat_alt) & (xyz.shape[1] > 2)
 
-        for sat in self.satellite_validated:
-            sat['plane_index'] = int(sat['plane'] // angle_threshold)
+        if self.E_to_W:
+            sat_lon = np.where(sat_lon < 0, sat_lon + 360, sat_lon)
 
-        plane_dict = defaultdict(list)
-        for sat in self.satellite_validated:
-            plane_dict[sat['plane_index']].append(sat)
+        indices = np.flatnonzero(valid)
+        self._set_validated([satellites[i] for i in indices],
+                            np.stack([sat_lat[indices], sat_lon[indices], sat_alt[indices]], axis=-1),
+                            xyz[indices, xyz.shape[1] // 2])
 
-        for p_idx, sat_list in plane_dict.items():
-            # Ordina per latitudine media calcolata dal track
-            for sat in sat_list:
-                lat_values = [pos[0] for pos in sat['track']]
-                mid_lat = sum(lat_values) / len(lat_values)
-                sat['mid_lat'] = mid_lat
+    def coarse_candidates(self, satellites, times, steps=ADAPTIVE_STEPS):
+        """
+        Indici dei satelliti (in satellites) che restano nelle regioni e nella
+        fascia di altitudine in tutti gli istanti di times multipli di ogni
+        passo di steps (più l'ultimo istante), controllando a ogni passo solo
+        i superstiti del precedente. Gli istanti grossolani sono un
+        sottoinsieme di quelli a 1 s, quindi un satellite scartato qui
+        sarebbe scartato anche dal controllo completo: la decisione finale
+        resta quella del campionamento a 1 s dei superstiti.
+        """
+        survivors = np.arange(len(satellites))
+        for step in steps:
+            samples = np.unique(np.r_[np.arange(0, len(times), step), len(times) - 1])
+            xyz = propagate_itrs([satellites[i] for i in survivors], times[samples])
+            survivors = survivors[self._within_regions(*itrs_to_geodetic(xyz))]
+        return survivors
+
+    def _within_regions(self, sat_lat, sat_lon, sat_alt):
+        # Un satellite è valido solo se resta in una regione per tutti i campioni
+        # (i NaN dovuti a errori SGP4 falliscono i confronti e lo scartano)
+        valid = np.zeros(len(sat_lat), dtype=bool)
+        altitude_ok = self._in_altitude_band(sat_alt)
+        for region in self.regions:
+            valid |= (self._in_region(region, sat_lat, sat_lon) & altitude_ok).all(axis=1)
+        if instrumentation.ENABLED:
+            altitude_ok = altitude_ok.all(axis=1)
+            instrumentation.count("rejected_altitude", np.count_nonzero(~altitude_ok))
+            instrumentation.count("rejected_bounding_box", np.count_nonzero(altitude_ok & ~valid))
+        return valid
 
-            sat_list.sort(key=lambda x: x['mid_lat'])
-            for i, sat in enumerate(sat_list):
-                sat['sat_index_in_plane'] = i
+    @staticmethod
+    def _in_altitude_band(sat_alt):
+        return (MIN_ALTITUDE_KM <= sat_alt) & (sat_alt <= MAX_ALTITUDE_KM)
+
+    @staticmethod
+    def _in_region(region, sat_lat, sat_lon):
+        # Funziona sia con scalari sia con array (lat, lon in gradi, lon in [-180, 180])
+        min_lat, max_lat, min_lon, max_lon, E_to_W = region
+        if E_to_W:
+            sat_lon = np.where(sat_lon < 0, sat_lon + 360, sat_lon)
+        return (min_lat <= sat_lat) & (sat_lat <= max_lat) & (min_lon <= sat_lon) & (sat_lon <= max_lon)
+
+    def _set_validated(self, satellites, tracks, xyz):
+        # RAAN in gradi (memorizzato in 'plane'); xyz: posizione ECEF (ITRS, km) a metà finestra
+        orbital_planes = np.degrees([sat.model.nodeo for sat in satellites]) % 360
+        self.satellite_validated = SatelliteTable([sat.name for sat in satellites], tracks, orbital_planes, xyz,
+                                                  self.E_to_W)
+
+    @instrumentation.timed("assign_plane_and_position")
+    def assign_plane_and_position(self, angle_threshold=10):
+        table = self.satellite_validated
+        table.plane_index = (table.plane // angle_threshold).astype(np.int64)
+
+        # Nello stesso piano i satelliti sono numerati per latitudine crescente a metà
+        # finestra (lexsort è stabile: a parità resta l'ordine di validazione)
+        order = np.lexsort((table.lat, table.plane_index))
+        planes = table.plane_index[order]
+        first = np.flatnonzero(np.r_[True, planes[1:] != planes[:-1]])
+        counts = np.diff(np.r_[first, len(order)])
+        table.sat_index_in_plane = np.empty(len(order), dtype=np.int64)
+        table.sat_index_in_plane[order] = np.arange(len(order)) - np.repeat(first, counts)
+        table.plane_grid = PlaneGrid(table.names, table.plane_index.tolist(), table.sat_index_in_plane.tolist(),
+                                     n_planes=int(np.ceil(360 / angle_threshold)))
 
     def find_satellite_more_close(self, city_lat, city_lon, satellites):
         """
-        Trova il satellite la cui posizione media (calcolata dal track) è la più vicina
+        Trova il satellite la cui posizione a metà finestra è la più vicina
         al punto (city_lat, city_lon)
         """
-        min_distance = float('inf')
-        node = None
-        for sat in satellites:
-            mid_lat = (sat['track'][0][0] + sat['track'][-1][0]) / 2
-            mid_lon = (sat['track'][0][1] + sat['track'][-1][1]) / 2
-            mid_alt = (sat['track'][0][2] + sat['track'][-1][2]) / 2
-            distance = euclidean_distance(city_lat, city_lon, 0, mid_lat, mid_lon, mid_alt)
-            if distance < min_distance:
-                node = (sat['name'], mid_lat, mid_lon)
-                min_distance = distance
-
-        return node
\ No newline at end of file
+        if not satellites:
+            return None
+        return self._access_nodes([city_lat], [city_lon], satellites, 1, None)[0][0]
+
+    @instrumentation.timed("find_access_satellites")
+    def find_access_satellites(self, stations, satellites, k=1, min_elevation=None):
+        """
+        Satelliti di accesso di più stazioni a terra (Topos) in un'unica
+        operazione vettoriale sulle posizioni ECEF a metà finestra: per ogni
+        stazione la lista dei k satelliti più vicini, come
+        (nome, lat, lon a metà finestra) in ordine di distanza, esclusi quelli con
+        elevazione sotto min_elevation gradi se indicata (la lista può essere
+        più corta di k o vuota).
+        """
+        return self._access_nodes([station.latitude.degrees for station in stations],
+                                  [station.longitude.degrees for station in stations], satellites, k, min_elevation)
+
+    def _access_nodes(self, station_lat, station_lon, satellites, k, min_elevation):
+        if isinstance(satellites, SatelliteTable):
+            names, lat, lon, xyz = satellites.names, satellites.lat, satellites.lon, satellites.xyz
+        else:
+            names = [sat['name'] for sat in satellites]
+            xyz = np.array([sat['xyz'] for sat in satellites]).reshape(-1, 3)
+            lat, lon, _ = itrs_to_geodetic(xyz)
+            if self.E_to_W:
+                lon = np.where(lon < 0, lon + 360, lon)
+        indices, _, _ = ground_access(station_lat, station_lon, xyz, k, min_elevation)
+
+        access = []
+        for row in indices.tolist():
+            nodes = []
+            for i in row:
+                if i < 0:
+                    break
+                nodes.append((names[i], lat[i], lon[i]))
+            access.append(nodes)
+        return access
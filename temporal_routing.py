@@ -0,0 +1,251 @@
+from collections import OrderedDict
+from datetime import timedelta
+from heapq import heappush, heappop
+from itertools import count
+
+import numpy as np
+from skyfield.constants import DAY_S
+
+import instrumentation
+from ephemeris import EphemerisStore
+from propagation import itrs_to_geodetic
+from utils import cartesian_distance, latency_calculation, pairs_within_range
+
+# Tempo di elaborazione per ogni satellite attraversato (s): lo stesso 1 ms per
+# satellite che test.py somma alla latenza di propagazione per l'RTT/2
+HOP_PROCESSING_S = 0.001
+
+
+class TimeExpandedGraph:
+    """
+    Grafo espanso nel tempo su una finestra di simulazione. Lo strato k
+    rappresenta l'intervallo [t_k, t_k + step]: un ISL esiste nello strato se
+    i due satelliti sono entro LISL_range sia a t_k sia a t_k + step, e gli
+    archi di attesa (k, s) -> (k + 1, s) permettono a un satellite di tenere il
+    pacchetto fino allo strato successivo (handover).
+    Gli strati non vengono mai materializzati tutti insieme: le posizioni si
+    leggono dalle effemeridi memory-mapped e gli ISL di ogni strato si
+    calcolano su richiesta in formato CSR (int32/float32), tenendo in memoria
+    solo gli ultimi cache_layers strati.
+    I tempi restituiti sono in secondi dall'inizio della finestra.
+    """
+
+    def __init__(self, start_time, duration=timedelta(minutes=90), step=timedelta(seconds=30),
+                 LISL_range=1300, load_factor=0.0, ephemeris=None, tle_file="gp.txt",
+                 alt_range=(500, 570), cache_layers=8):
+        self.start_time = start_time
+        self.step_s = step.total_seconds()
+        self.n_layers = int(round(duration.total_seconds() / self.step_s))
+        self.LISL_range = LISL_range
+        self.load_factor = load_factor
+        self.alt_range = alt_range
+        self.cache_layers = cache_layers
+
+        # Effemeridi campionate al passo degli strati, salvo che ne vengano passate di più fitte
+        if ephemeris is None:
+            ephemeris = EphemerisStore.load_or_build(start_time, duration=duration, step=step, tle_file=tle_file)
+        stride = self.step_s / ephemeris.step_s
+        if abs(stride - round(stride)) > 1e-9:
+            raise ValueError(f"Il passo degli strati ({self.step_s} s) non è multiplo di quello delle effemeridi")
+        self.ephemeris = ephemeris
+        self.first_sample = ephemeris.index_of(start_time)
+        self.stride = int(round(stride))
+        # Verifica che la finestra sia coperta dalle effemeridi
+        ephemeris.index_of(start_time + timedelta(seconds=self.n_layers * self.step_s))
+
+        self.names = [sat.name for sat in ephemeris.satellites]
+        self._samples = OrderedDict()  # k -> (xyz, valid)
+        self._layers = OrderedDict()   # k -> (indptr, indices, costs)
+
+    def layer_time(self, k):
+        return k * self.step_s
+
+    def layer_of(self, t):
+        """Strato che contiene l'istante t (Time di Skyfield)."""
+        offset = (t - self.start_time) * DAY_S
+        k = int(np.floor(offset / self.step_s + 1e-9))
+        if not (0 <= k < self.n_layers):
+            raise ValueError(f"Istante {t.utc_iso()} fuori dalla finestra del grafo")
+        return k, offset
+
+    def _link_cost(self, distance):
+        # Latenza di propagazione con il fattore di carico, come in SatelliteGraph
+        return latency_calculation(distance) * (1 / (1 - self.load_factor))
+
+    def _sample(self, k):
+        # Posizioni (n_sat, 3) all'istante t_k e satelliti validi (posizione nota e quota nel range)
+        if k in self._samples:
+            self._samples.move_to_end(k)
+            return self._samples[k]
+        xyz = np.asarray(self.ephemeris.positions[self.first_sample + k * self.stride], dtype=np.float64)
+        _, _, alt = itrs_to_geodetic(xyz)
+        valid = (self.alt_range[0] <= alt) & (alt <= self.alt_range[1])
+        self._samples[k] = (xyz, valid)
+        if len(self._samples) > self.cache_layers + 1:
+            self._samples.popitem(last=False)
+        return xyz, valid
+
+    @instrumentation.timed("time_expanded_layer")
+    def layer(self, k):
+        """
+        ISL dello strato k in formato CSR sugli indici del catalogo:
+        (indptr, indices, costi in s con l'elaborazione del satellite di arrivo).
+        """
+        if k in self._layers:
+            self._layers.move_to_end(k)
+            return self._layers[k]
+
+        xyz, valid = self._sample(k)
+        xyz_next, valid_next = self._sample(k + 1)
+        nodes = np.flatnonzero(valid & valid_next)
+        i, j, distance = pairs_within_range(xyz[nodes], self.LISL_range)
+        i = nodes[i]
+        j = nodes[j]
+        # Il collegamento deve restare in range per tutto l'intervallo dello strato
+        keep = cartesian_distance(xyz_next[i], xyz_next[j]) <= self.LISL_range
+        i, j, distance = i[keep], j[keep], distance[keep]
+
+        rows = np.concatenate([i, j])
+        order = np.argsort(rows, kind='stable')
+        indptr = np.zeros(len(self.names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(self.names)), out=indptr[1:])
+        indices = np.concatenate([j, i])[order].astype(np.int32)
+        costs = (self._link_cost(np.concatenate([distance, distance])) + HOP_PROCESSING_S)[order].astype(np.float32)
+
+        self._layers[k] = (indptr, indices, costs)
+        if len(self._layers) > self.cache_layers:
+            self._layers.popitem(last=False)
+        return self._layers[k]
+
+    def nbytes(self):
+        # Memoria occupata dagli strati attualmente in cache
+        return sum(array.nbytes for arrays in self._layers.values() for array in arrays)
+
+    def access(self, city, k):
+        """
+        Satellite di accesso della città nello strato k (il più vicino, come
+        find_satellite_more_close) e latenza del collegamento terra-satellite.
+        """
+        xyz, valid = self._sample(k)
+        candidates = np.flatnonzero(valid)
+        distances = cartesian_distance(city.itrs_xyz.km, xyz[candidates])
+        best = int(np.argmin(distances))
+        return int(candidates[best]), self._link_cost(float(distances[best]))
+
+    def _layer_dijkstra(self, k, seeds, target=None):
+        """
+        Dijkstra sui tempi di arrivo nello strato k a partire da seeds
+        (satellite -> (tempo, predecessore)). Da un satellite si riparte solo
+        se il pacchetto vi arriva prima della fine dello strato. La ricerca si
+        ferma sul target solo se vi arriva entro lo strato; altrimenti
+        continua, così dist contiene tutti i satelliti raggiunti (che
+        earliest_arrival tiene a bordo per lo strato successivo).
+        """
+        indptr, indices, costs = self.layer(k)
+        end = self.layer_time(k + 1)
+        dist = {}
+        pred = {}
+        c = count()
+        fringe = []
+        for node, (time, previous) in seeds.items():
+            heappush(fringe, (time, next(c), node))
+            pred[node] = previous
+        seen = {node: time for node, (time, _) in seeds.items()}
+
+        while fringe:
+            time, _, v = heappop(fringe)
+            if v in dist:
+                continue
+            dist[v] = time
+            if v == target and time < end:
+                break
+            if time >= end:
+                continue
+            first, last = indptr[v], indptr[v + 1]
+            for u, cost in zip(indices[first:last].tolist(), costs[first:last].tolist()):
+                if u in dist:
+                    continue
+                arrival = time + cost
+                if u not in seen or arrival < seen[u]:
+                    seen[u] = arrival
+                    heappush(fringe, (arrival, next(c), u))
+                    pred[u] = (k, v)
+        instrumentation.count("dijkstra_nodes_settled", len(dist))
+        return dist, pred
+
+    def earliest_arrival(self, city1, city2, depart_time=None):
+        """
+        Primo istante in cui un pacchetto partito da city1 a depart_time
+        (inizio finestra se None) può arrivare a city2, con attesa a bordo
+        dei satelliti se il percorso non esiste ancora. Restituisce un
+        dizionario con partenza, arrivo, latenza (s) e percorso come lista di
+        (strato, satellite), oppure None se nella finestra non si arriva.
+        """
+        if depart_time is None:
+            k0, departure = 0, 0.0
+        else:
+            k0, departure = self.layer_of(depart_time)
+
+        carried = {}  # satellite -> (tempo, predecessore) dei pacchetti tenuti a bordo
+        preds = {}
+        for k in range(k0, self.n_layers):
+            start = max(departure, self.layer_time(k))
+            # La città può trasmettere anche al satellite di accesso dello strato corrente
+            source, uplink = self.access(city1, k)
+            seeds = dict(carried)
+            uplink_time = start + uplink + HOP_PROCESSING_S
+            if source not in seeds or uplink_time < seeds[source][0]:
+                seeds[source] = (uplink_time, None)
+
+            target, downlink = self.access(city2, k)
+            dist, pred = self._layer_dijkstra(k, seeds, target)
+            preds[k] = pred
+            if target in dist and dist[target] < self.layer_time(k + 1):
+                return {
+                    'departure': departure,
+                    'arrival': dist[target] + downlink,
+                    'latency': dist[target] + downlink - departure,
+                    'path': self._build_path(preds, k, target),
+                }
+            # I pacchetti restano a bordo e ripartono non prima dell'inizio dello strato successivo
+            next_start = self.layer_time(k + 1)
+            carried = {node: (max(time, next_start), (k, node)) for node, time in dist.items()}
+        return None
+
+    def min_latency(self, city1, city2):
+        """
+        Percorso di latenza minima tra le due città su tutta la finestra: per
+        ogni strato si calcola il percorso in partenza a t_k e si sceglie il
+        migliore. Restituisce un dizionario con latenza (s), partenza, strato,
+        percorso e l'array delle latenze di ogni strato (NaN se irraggiungibile).
+        """
+        latencies = np.full(self.n_layers, np.nan)
+        best = None
+        for k in range(self.n_layers):
+            start = self.layer_time(k)
+            source, uplink = self.access(city1, k)
+            target, downlink = self.access(city2, k)
+            dist, pred = self._layer_dijkstra(k, {source: (start + uplink + HOP_PROCESSING_S, None)}, target)
+            if target not in dist or dist[target] >= self.layer_time(k + 1):
+                continue
+            latencies[k] = dist[target] + downlink - start
+            if best is None or latencies[k] < best['latency']:
+                best = {
+                    'latency': latencies[k],
+                    'departure': start,
+                    'layer': k,
+                    'path': self._build_path({k: pred}, k, target),
+                }
+        if best is not None:
+            best['latencies'] = latencies
+        return best
+
+    def _build_path(self, preds, k, node):
+        path = []
+        step = (k, node)
+        while step is not None:
+            k, node = step
+            path.append((k, self.names[node]))
+            step = preds[k][node]
+        path.reverse()
+        return path
@@ -1,30 +1,223 @@
 import numpy as np
 import math
+from itertools import product
+from skyfield.toposlib import iers2010
 
-def euclidean_distance(lat1, lon1, alt1, lat2, lon2, alt2):
-    R = 6378.137 # Raggio medio della Terra in km
+import instrumentation
+
+R_EARTH = 6378.137 # Raggio medio della Terra in km
+
+def cartesian_coordinates(lat, lon, alt):
+    R = R_EARTH
 
     # Converte latitudine e longitudine in radianti
-    lat1_rad = np.radians(lat1)
-    lon1_rad = np.radians(lon1)
-    lat2_rad = np.radians(lat2)
-    lon2_rad = np.radians(lon2)
+    lat_rad = np.radians(lat)
+    lon_rad = np.radians(lon)
 
-    # Calcola le coordinate cartesiane per il primo punto
-    x1 = (R + alt1) * np.cos(lat1_rad) * np.cos(lon1_rad)
-    y1 = (R + alt1) * np.cos(lat1_rad) * np.sin(lon1_rad)
-    z1 = (R + alt1) * np.sin(lat1_rad)
+    # Calcola le coordinate cartesiane del punto
+    x = (R + alt) * np.cos(lat_rad) * np.cos(lon_rad)
+    y = (R + alt) * np.cos(lat_rad) * np.sin(lon_rad)
+    z = (R + alt) * np.sin(lat_rad)
 
-    # Calcola le coordinate cartesiane per il secondo punto
-    x2 = (R + alt2) * np.cos(lat2_rad) * np.cos(lon2_rad)
-    y2 = (R + alt2) * np.cos(lat2_rad) * np.sin(lon2_rad)
-    z2 = (R + alt2) * np.sin(lat2_rad)
+    return x, y, z
+
+def euclidean_distance(lat1, lon1, alt1, lat2, lon2, alt2):
+    # Calcola le coordinate cartesiane dei due punti
+    x1, y1, z1 = cartesian_coordinates(lat1, lon1, alt1)
+    x2, y2, z2 = cartesian_coordinates(lat2, lon2, alt2)
 
     # Calcola la distanza euclidea
     distance = np.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2 + (z2 - z1) ** 2)
 
     return distance
 
+def ground_station_xyz(lat, lon):
+    # Coordinate ECEF (ITRS, km) di un punto a terra sul geoide IERS2010,
+    # lo stesso usato per le posizioni dei satelliti e dai Topos di Skyfield
+    return iers2010.latlon(lat, lon).itrs_xyz.km
+
+def cartesian_distance(p1, p2):
+    """
+    Distanza euclidea tra coordinate ECEF (km) con forma (..., 3), con
+    broadcasting: punto-punto, punto-insieme (p1 (3,), p2 (n, 3)) o insieme-insieme.
+    Usa solo prodotti, somme e sqrt, quindi il risultato è identico bit a bit
+    sia su scalari sia su array.
+    """
+    d = np.asarray(p2) - np.asarray(p1)
+    return np.sqrt(d[..., 0] * d[..., 0] + d[..., 1] * d[..., 1] + d[..., 2] * d[..., 2])
+
+def distance_matrix(xyz1, xyz2):
+    # Matrice (n1, n2) delle distanze tra due insiemi di coordinate ECEF
+    return cartesian_distance(np.asarray(xyz1)[:, None, :], np.asarray(xyz2)[None, :, :])
+
+# Offset delle 13 celle adiacenti "in avanti" di una griglia 3-D: con la cella
+# stessa coprono ogni coppia di celle adiacenti una sola volta
+GRID_FORWARD_OFFSETS = [offset for offset in product((-1, 0, 1), repeat=3) if offset > (0, 0, 0)]
+
+# Numero massimo di coppie candidate valutate insieme, per limitare la memoria
+PAIRS_CHUNK = 2000000
+
+def pairs_within_range(xyz, max_distance):
+    """
+    Restituisce le coppie (i, j), con i < j, di punti xyz (array (n, 3) in km)
+    a distanza <= max_distance e le loro distanze, usando una griglia uniforme
+    3-D con celle di lato max_distance: ogni punto viene confrontato solo con
+    quelli della propria cella e delle 26 adiacenti.
+    Le celle sono indicizzate da una chiave intera e i punti ordinati per
+    chiave, così i vicini di tutti i punti si trovano con searchsorted senza
+    cicli Python sulle celle.
+    Le coppie sono ordinate come nel doppio ciclo i < j.
+    """
+    xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+    empty = np.empty(0, dtype=np.int64)
+    if len(xyz) == 0:
+        return empty, empty, np.empty(0)
+
+    # Chiave della cella, con un margine di una cella per gli offset -1
+    cells = np.floor(xyz / max_distance).astype(np.int64)
+    cells -= cells.min(axis=0) - 1
+    dims = cells.max(axis=0) + 2
+    key = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    order = np.argsort(key, kind='stable')
+    sorted_key = key[order]
+
+    i_list, j_list, d_list = [], [], []
+    for dx, dy, dz in [(0, 0, 0)] + GRID_FORWARD_OFFSETS:
+        neighbor_key = key + (dx * dims[1] + dy) * dims[2] + dz
+        first = np.searchsorted(sorted_key, neighbor_key, side='left')
+        counts = np.searchsorted(sorted_key, neighbor_key, side='right') - first
+        ends = np.cumsum(counts)
+
+        # Blocchi di punti con al più PAIRS_CHUNK candidati
+        start = 0
+        while start < len(xyz):
+            stop = max(int(np.searchsorted(ends, ends[start] - counts[start] + PAIRS_CHUNK, side='right')),
+                       start + 1)
+            block_counts = counts[start:stop]
+            p = np.repeat(np.arange(start, stop), block_counts)
+            position = np.arange(len(p)) - np.repeat(np.cumsum(block_counts) - block_counts, block_counts)
+            q = order[np.repeat(first[start:stop], block_counts) + position]
+            instrumentation.count("candidate_pairs", len(p))
+            if (dx, dy, dz) == (0, 0, 0):
+                keep = p < q
+                p = p[keep]
+                q = q[keep]
+            i = np.minimum(p, q)
+            j = np.maximum(p, q)
+            distance = cartesian_distance(xyz[i], xyz[j])
+            keep = distance <= max_distance
+            i_list.append(i[keep])
+            j_list.append(j[keep])
+            d_list.append(distance[keep])
+            start = stop
+
+    i = np.concatenate(i_list)
+    j = np.concatenate(j_list)
+    distance = np.concatenate(d_list)
+    order = np.lexsort((j, i))
+    return i[order], j[order], distance[order]
+
+def nearest_neighbors(xyz, queries, k, max_distance):
+    """
+    I k punti più vicini (diversi da lui) entro max_distance di ogni punto di
+    indice in queries, per tutte le query insieme, a blocchi di righe della
+    matrice delle distanze. Restituisce (neighbors, distances, complete):
+    neighbors e distances hanno forma (len(queries), k), sono ordinati per
+    distanza e a parità per indice (-1 e inf dove i vicini sono meno di k);
+    complete[r] è False se la query r ha altri vicini entro max_distance
+    oltre ai k restituiti.
+    """
+    xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+    queries = np.asarray(queries, dtype=np.int64).reshape(-1)
+    k = max(1, min(k, len(xyz)))
+    neighbors = np.full((len(queries), k), -1, dtype=np.int64)
+    distances = np.full((len(queries), k), np.inf)
+    complete = np.ones(len(queries), dtype=bool)
+
+    rows = max(1, PAIRS_CHUNK // max(len(xyz), 1))
+    for start in range(0, len(queries), rows):
+        block = queries[start:start + rows]
+        d = distance_matrix(xyz[block], xyz)
+        d[np.arange(len(block)), block] = np.inf
+        d[d > max_distance] = np.inf
+
+        nearest, nearest_d = _k_smallest(d, k)
+        found = np.isfinite(nearest_d)
+        neighbors[start:start + len(block)] = np.where(found, nearest, -1)
+        distances[start:start + len(block)] = nearest_d
+        complete[start:start + len(block)] = np.count_nonzero(np.isfinite(d), axis=1) <= k
+    return neighbors, distances, complete
+
+def _k_smallest(d, k):
+    """
+    Indici e valori dei k elementi minori di ogni riga di d, ordinati per
+    valore e a parità per indice (lo stesso ordine di un ordinamento completo).
+    """
+    nearest = np.argpartition(d, k - 1, axis=1)[:, :k] if k < d.shape[1] else \
+        np.broadcast_to(np.arange(d.shape[1]), d.shape)
+    nearest_d = np.take_along_axis(d, nearest, axis=1)
+    order = np.lexsort((nearest, nearest_d))
+    nearest = np.take_along_axis(nearest, order, axis=1)
+    nearest_d = np.take_along_axis(nearest_d, order, axis=1)
+
+    # Con un pareggio al k-esimo posto argpartition sceglie fra gli indici pari merito
+    # in modo arbitrario: quelle righe vengono ordinate per intero
+    kth = nearest_d[:, -1:]
+    within = np.count_nonzero(d <= kth, axis=1)
+    for r in np.flatnonzero(np.isfinite(kth[:, 0]) & (within > k)):
+        full = np.lexsort((np.arange(d.shape[1]), d[r]))[:k]
+        nearest[r], nearest_d[r] = full, d[r, full]
+    return nearest, nearest_d
+
+def elevation_angles(station_lat, station_lon, station_xyz, sat_xyz):
+    """
+    Matrice (n_stazioni, n_satelliti) delle elevazioni (gradi) dei satelliti
+    sull'orizzonte geodetico di ogni stazione a terra (lat, lon in gradi,
+    station_xyz e sat_xyz coordinate ECEF in km).
+    """
+    lat = np.radians(np.asarray(station_lat, dtype=np.float64))[:, None]
+    lon = np.radians(np.asarray(station_lon, dtype=np.float64))[:, None]
+    d = np.asarray(sat_xyz)[None, :, :] - np.asarray(station_xyz)[:, None, :]
+    # Componente lungo la verticale locale (normale all'ellissoide)
+    up = np.cos(lat) * np.cos(lon) * d[..., 0] + np.cos(lat) * np.sin(lon) * d[..., 1] + np.sin(lat) * d[..., 2]
+    return np.degrees(np.arcsin(np.clip(up / np.sqrt(np.sum(d * d, axis=-1)), -1.0, 1.0)))
+
+def ground_access(station_lat, station_lon, sat_xyz, k=1, min_elevation=None):
+    """
+    Satelliti di accesso di più stazioni a terra (lat, lon in gradi) in
+    un'unica operazione vettoriale: per ogni stazione i k satelliti di sat_xyz
+    (posizioni ECEF in km) più vicini, esclusi quelli sotto min_elevation
+    gradi se indicato. Restituisce (indices, distances, elevations) con forma
+    (n_stazioni, k), ordinati per distanza e a parità per indice; dove i
+    satelliti visibili sono meno di k gli indici valgono -1, le distanze inf e
+    le elevazioni nan. Con k=1 e senza maschera il satellite è quello di
+    find_satellite_more_close.
+    """
+    station_lat = np.asarray(station_lat, dtype=np.float64).reshape(-1)
+    station_lon = np.asarray(station_lon, dtype=np.float64).reshape(-1)
+    sat_xyz = np.asarray(sat_xyz, dtype=np.float64).reshape(-1, 3)
+    station_xyz = np.array([ground_station_xyz(lat, lon) for lat, lon in zip(station_lat, station_lon)]).reshape(-1, 3)
+    indices = np.full((len(station_lat), k), -1, dtype=np.int64)
+    distances = np.full((len(station_lat), k), np.inf)
+    elevations = np.full((len(station_lat), k), np.nan)
+    if len(sat_xyz) == 0:
+        return indices, distances, elevations
+
+    kk = min(k, len(sat_xyz))
+    rows = max(1, PAIRS_CHUNK // len(sat_xyz))
+    for start in range(0, len(station_lat), rows):
+        block = slice(start, start + rows)
+        d = distance_matrix(station_xyz[block], sat_xyz)
+        elevation = elevation_angles(station_lat[block], station_lon[block], station_xyz[block], sat_xyz)
+        if min_elevation is not None:
+            d[elevation < min_elevation] = np.inf
+        nearest, nearest_d = _k_smallest(d, kk)
+        found = np.isfinite(nearest_d)
+        indices[block, :kk] = np.where(found, nearest, -1)
+        distances[block, :kk] = nearest_d
+        elevations[block, :kk] = np.where(found, np.take_along_axis(elevation, nearest, axis=1), np.nan)
+    return indices, distances, elevations
+
 # calcolo latenza
 # per calcolare la latenza devo prendere la distanza tra due satelliti e dividere per la velocità della luce
 def latency_calculation(distance):
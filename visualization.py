@@ -2,8 +2,29 @@ import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.basemap import Basemap
 import data_handler
+import instrumentation
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.colors import to_rgba
 from matplotlib.lines import Line2D  # per la legenda personalizzata
 
+# Basemap già costruite, per limiti e risoluzione: la costruzione (linee di costa
+# e confini alla risoluzione 'i') è la parte più costosa di ogni figura
+_basemap_cache = {}
+
+
+def cached_basemap(llcrnrlat, urcrnrlat, llcrnrlon, urcrnrlon, resolution='i'):
+    key = (llcrnrlat, urcrnrlat, llcrnrlon, urcrnrlon, resolution)
+    if key not in _basemap_cache:
+        _basemap_cache[key] = Basemap(
+            projection='merc',
+            llcrnrlat=llcrnrlat,
+            urcrnrlat=urcrnrlat,
+            llcrnrlon=llcrnrlon,
+            urcrnrlon=urcrnrlon,
+            resolution=resolution
+        )
+    return _basemap_cache[key]
+
 
 class SatelliteVisualization:
 
@@ -47,15 +68,8 @@ class SatelliteVisualization:
             mng = plt.get_current_fig_manager()
             mng.full_screen_toggle()
 
-        # Crea la mappa con i limiti calcolati
-        self.m = Basemap(
-            projection='merc',
-            llcrnrlat=llcrnrlat,
-            urcrnrlat=urcrnrlat,
-            llcrnrlon=llcrnrlon,
-            urcrnrlon=urcrnrlon,
-            resolution='i'
-        )
+        # Crea la mappa con i limiti calcolati (riusata tra snapshot con gli stessi limiti)
+        self.m = cached_basemap(llcrnrlat, urcrnrlat, llcrnrlon, urcrnrlon)
 
     def add_cities(self):
         cities = [
@@ -66,10 +80,11 @@ class SatelliteVisualization:
             x, y = self.m(city['lon'], city['lat'])
             self.m.plot(x, y, marker='o', color=city['color'], markersize=8)
 
+    @instrumentation.timed("draw_map")
     def draw_map(self):
         self.m.drawcoastlines()
         self.m.drawcountries()
-        self.m.fillcontinents(color='lightgray')
+        self.fill_continents(color='lightgray')
 
         # Calcola i paralleli in base ai limiti della mappa
         llcrnrlat = int(np.floor(self.m.llcrnrlat / 10.0) * 10)
@@ -92,6 +107,16 @@ class SatelliteVisualization:
                 lbl.set_rotation(45)
                 lbl.set_horizontalalignment('right')
 
+    def fill_continents(self, color):
+        # Come Basemap.fillcontinents (laghi con il colore di sfondo), ma con un'unica
+        # PolyCollection invece di un Polygon per ogni poligono di costa
+        ax = plt.gca()
+        lakes = np.isin(self.m.coastpolygontypes, (2, 4))
+        colors = np.where(lakes[:, None], ax.get_facecolor(), to_rgba(color))
+        polygons = [np.column_stack([x, y]) for x, y in self.m.coastpolygons]
+        ax.add_collection(PolyCollection(polygons, facecolors=colors, edgecolors=colors, linewidths=0))
+        self.m.set_axes_limits(ax=ax)
+
     def plot_tracks(self):
         # Disegna le traiettorie dei satelliti validati
         for sat in self.satellite_validated:
@@ -100,32 +125,45 @@ class SatelliteVisualization:
             x, y = self.m(lons, lats)
             self.m.plot(x, y, linewidth=1)
 
+    def _project_nodes(self):
+        # Proietta tutti i nodi del grafo con una sola chiamata: indice del nodo e coordinate (x, y)
+        if not hasattr(self, '_node_xy'):
+            nodes = list(self.graph.nodes(data=True))
+            lon = np.array([data['lon'] for _, data in nodes], dtype=float)
+            lat = np.array([data['lat'] for _, data in nodes], dtype=float)
+            x, y = self.m(lon, lat)
+            self._node_index = {node: k for k, (node, _) in enumerate(nodes)}
+            self._node_xy = np.column_stack([x, y])
+        return self._node_index, self._node_xy
+
+    @instrumentation.timed("plot_nodes")
     def plot_nodes(self, path=None):
-        # Disegna i nodi del grafo (satelliti).
-        for node, data in self.graph.nodes(data=True):
-            x, y = self.m(data['lon'], data['lat'])
-            if node == self.start[0]:
-                self.m.plot(x, y, marker='o', color='red', markersize=6)
-            elif node == self.end[0]:
-                self.m.plot(x, y, marker='o', color='purple', markersize=6)
-            else:
-                self.m.plot(x, y, marker='o', color='blue', markersize=4)
+        # Disegna i nodi del grafo (satelliti) con un solo scatter; sorgente e destinazione sopra gli altri
+        index, xy = self._project_nodes()
+        colors = np.full(len(xy), 'blue', dtype=object)
+        sizes = np.full(len(xy), 4.0)  # diametro in punti, come markersize
+        last = []
+        for node, color in ((self.start[0], 'red'), (self.end[0], 'purple')):
+            if node in index:
+                colors[index[node]] = color
+                sizes[index[node]] = 6.0
+                last.append(index[node])
+        order = np.concatenate([np.setdiff1d(np.arange(len(xy)), last), last]).astype(int)
+
+        ax = plt.gca()
+        ax.scatter(xy[order, 0], xy[order, 1], s=sizes[order] ** 2, c=colors[order].tolist(), marker='o',
+                   edgecolors='face', linewidths=1.0, zorder=2)
+        self.m.set_axes_limits(ax=ax)
 
+    @instrumentation.timed("plot_edges")
     def plot_edges(self, path_d, path_m, range_value, path_label="Percorso"):
         # Disegna gli archi del grafo per entrambi i percorsi calcolati
+        index, xy = self._project_nodes()
+        ax = plt.gca()
 
-        # Coordinate città trasformate
-        x_city1, y_city1 = self.m(self.city1_lon, self.city1_lat)
-        x_city2, y_city2 = self.m(self.city2_lon, self.city2_lat)
-
-        # Disegno le connessioni tra nodi (non in percorso) con linewidth ridotto
-        for u, v, data in self.graph.edges(data=True):
-            node1 = self.graph.nodes[u]
-            node2 = self.graph.nodes[v]
-            x1, y1 = self.m(node1['lon'], node1['lat'])
-            x2, y2 = self.m(node2['lon'], node2['lat'])
-            self.m.plot([x1, x2], [y1, y2], color='red', linewidth=0.2)
-
+        # Disegno le connessioni tra nodi (non in percorso) con linewidth ridotto, in un'unica collezione
+        edges = np.array([(index[u], index[v]) for u, v in self.graph.edges()], dtype=int).reshape(-1, 2)
+        ax.add_collection(LineCollection(xy[edges], colors='red', linewidths=0.2, zorder=2))
 
         paths = [(path_d, 'cyan', 'Percorso Dijkstra'), (path_m, 'lime', 'Percorso MinHop')]
 
@@ -133,30 +171,14 @@ class SatelliteVisualization:
             if path is None or len(path) == 0:
                 continue  # Salta se il percorso non esiste
 
-            # Collega città al primo e all'ultimo satellite del percorso
-            first_sat = path[0]
-            last_sat = path[-1]
-            first_node = self.graph.nodes[first_sat]
-            last_node = self.graph.nodes[last_sat]
-            x_first, y_first = self.m(first_node['lon'], first_node['lat'])
-            x_last, y_last = self.m(last_node['lon'], last_node['lat'])
-
-            # Traccio il percorso con linewidth maggiore
-            plotted_label = False
-            for i in range(len(path) - 1):
-                u = path[i]
-                v = path[i + 1]
-                node1 = self.graph.nodes[u]
-                node2 = self.graph.nodes[v]
-                x1, y1 = self.m(node1['lon'], node1['lat'])
-                x2, y2 = self.m(node2['lon'], node2['lat'])
-                if not plotted_label:
-                    self.m.plot([x1, x2], [y1, y2], color=color, linewidth=3, label=label)
-                    plotted_label = True
-                else:
-                    self.m.plot([x1, x2], [y1, y2], color=color, linewidth=3)
-
-    def show(self, save_as_png=False):
+            # Traccio il percorso con linewidth maggiore, come un'unica spezzata
+            path_xy = xy[[index[node] for node in path]]
+            ax.plot(path_xy[:, 0], path_xy[:, 1], color=color, linewidth=3, label=label)
+
+        self.m.set_axes_limits(ax=ax)
+
+    @instrumentation.timed("show_map")
+    def show(self, save_as_png=False, filename="satellite_map.png", dpi=600):
 
         legend_elements = [
             # Città
@@ -188,6 +210,6 @@ class SatelliteVisualization:
         ax.legend(handles=legend_elements, loc='upper right', fontsize=10)
 
         if save_as_png:
-            data_handler.DataHandler.save_map_as_png("satellite_map.png")
+            data_handler.DataHandler.save_map_as_png(filename, dpi)
         else:
             plt.show()
\ No newline at end of file